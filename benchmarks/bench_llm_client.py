@@ -0,0 +1,123 @@
+"""
+LLMClient against a local stub endpoint: a hanging API, a flaky one and a
+healthy one.
+
+For the hanging endpoint every call should cost one timeout (read
+timeouts are not retried) and the breaker should open after
+BREAKER_MIN_CALLS failures, after which calls fail in microseconds. The
+flaky endpoint (5xx twice, then 200) should succeed through retries.
+A broken endpoint (malformed chunked body) must still settle the
+breaker's half-open trial, so the client recovers once the API does.
+
+    python benchmarks/bench_llm_client.py --timeout 0.5 --calls 10
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main_llm
+from main_llm import CircuitOpenError, LLMClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    hang_seconds = 5.0
+    flaky_left = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/broken":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"zz\r\nnot a chunk\r\n")
+            self.close_connection = True
+            return
+        if self.path == "/hang":
+            time.sleep(self.hang_seconds)
+            return self._reply(200, {"result": {}})
+        if self.path.startswith("/flaky"):
+            with self.lock:
+                left = self.flaky_left.setdefault(self.path, 2)
+                self.flaky_left[self.path] = left - 1
+            if left > 0:
+                return self._reply(503, {"error": "busy"})
+        self._reply(200, {"result": {"result": "{}"}})
+
+
+def timed_calls(client, n):
+    out = []
+    for _ in range(n):
+        t = time.perf_counter()
+        try:
+            client.post_task({"row": 1})
+            outcome = "ok"
+        except CircuitOpenError:
+            outcome = "breaker open"
+        except Exception as e:
+            outcome = type(e).__name__
+        out.append((outcome, time.perf_counter() - t))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--timeout", type=float, default=0.5)
+    ap.add_argument("--calls", type=int, default=10)
+    args = ap.parse_args()
+
+    main_llm.LLM_BACKOFF_BASE = 0.05
+    StubHandler.hang_seconds = args.timeout * 10
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"timeout={args.timeout}s  retries={main_llm.LLM_MAX_RETRIES}  "
+          f"breaker opens after {main_llm.BREAKER_MIN_CALLS} calls at {main_llm.BREAKER_ERROR_RATE:.0%} errors")
+    for name in ("hang", "flaky", "ok"):
+        client = LLMClient(name, f"{base}/{name}", args.timeout, rate=1000)
+        results = timed_calls(client, args.calls if name == "hang" else 1)
+        total = sum(t for _, t in results)
+        print(f"\n/{name}: {total:.2f}s for {len(results)} call(s)")
+        for i, (outcome, t) in enumerate(results, 1):
+            print(f"  call {i:>2}  {t:>7.3f}s  {outcome}")
+
+    hang = [t for outcome, t in timed_calls(LLMClient("hang", f"{base}/hang", args.timeout, rate=1000), 1)]
+    assert hang[0] < args.timeout * 2, "read timeouts must not be retried"
+
+    # Half-open trial that fails with a non-timeout error, then recovery
+    main_llm.BREAKER_COOLDOWN = 0.2
+    client = LLMClient("broken", f"{base}/broken", args.timeout, rate=1000)
+    tripped = timed_calls(client, main_llm.BREAKER_MIN_CALLS + 1)
+    time.sleep(0.25)
+    trial = timed_calls(client, 1)
+    time.sleep(0.25)
+    client.url = f"{base}/ok"
+    recovered = timed_calls(client, 1)
+    print(f"\n/broken: {[o for o, _ in tripped]}")
+    print(f"  trial after cooldown: {trial[0][0]}  →  /ok after next cooldown: {recovered[0][0]}")
+    assert recovered[0][0] == "ok", "breaker stuck half-open"
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Parse time per input format: XLSX vs CSV (pyarrow) vs Parquet.
+
+Writes the same applicant table in all three formats, then times the
+whole-file reader (read_sheets) and the streaming reader (iter_chunks)
+for each. Times are relative to whole-file XLSX, the only format the
+endpoints accepted before.
+
+    python benchmarks/bench_parse.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+
+import main_llm
+
+
+def make_frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "ID":       [f"A{100000 + i}" for i in range(n)],
+        "Name":     ["Ravi Kumar"] * n,
+        "Mobile":   ["9876543210"] * n,
+        "Mail":     [f"row{i}@example.com" for i in range(n)],
+        "Aadhaar":  ["123412341234"] * n,
+        "PAN":      ["ABCDE1234F"] * n,
+        "Loan":     ["2000000"] * n,
+        "Purpose":  ["car"] * n,
+        "Job":      ["salaried"] * n,
+        "Income":   ["50000"] * n,
+    })
+
+
+def timed(fn):
+    t = time.perf_counter()
+    rows = fn()
+    return rows, time.perf_counter() - t
+
+
+def whole(path, fmt):
+    return sum(len(df) for df in main_llm.read_sheets(path, fmt).values())
+
+
+def streamed(path, fmt):
+    chunks, _ = main_llm.iter_chunks(path, fmt)
+    return sum(len(df) for _, df in chunks)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="loansense-bench-")
+    df = make_frame(args.rows)
+    paths = {fmt: os.path.join(tmp, f"applicants.{fmt}") for fmt in main_llm.INPUT_FORMATS}
+    df.to_excel(paths["xlsx"], index=False)
+    df.to_csv(paths["csv"], index=False)
+    df.to_parquet(paths["parquet"], index=False)
+
+    results = {}
+    for fmt, path in paths.items():
+        for mode, fn in (("whole", whole), ("stream", streamed)):
+            rows, secs = timed(lambda: fn(path, fmt))
+            assert rows == args.rows, (fmt, mode, rows)
+            results[fmt, mode] = secs
+
+    base = results["xlsx", "whole"]
+    print(f"{args.rows:,} rows")
+    print(f"{'format':<8}  {'size':>9}  {'mode':<6}  {'seconds':>8}  {'rows/s':>11}  {'vs xlsx':>8}")
+    for (fmt, mode), secs in results.items():
+        size = os.path.getsize(paths[fmt]) / 2**20
+        print(f"{fmt:<8}  {size:>7.1f}MB  {mode:<6}  {secs:>8.2f}  {args.rows / secs:>11,.0f}  {secs / base:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Repair LLM calls on a systematically jumbled file: every row sent to the
+repair LLM vs a repaired sample whose column shift is replayed on the rest.
+
+Every row has its loan amount and email swapped and no income, so neither
+triage nor the local unjumbler can place it (a 5-10 lakh amount fits both
+loan and income) and all of them are LLM-bound. The stubbed LLM swaps the
+two fields back after a fixed sleep; both runs must give the same output.
+
+    python benchmarks/bench_permutation.py --sizes 1000 10000 --llm-latency 0.02
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="loansense-bench-"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+
+import main_llm
+
+
+class NoCache:
+    """Keeps repair answers from one run leaking into the next."""
+
+    def get(self, row):
+        return None
+
+    def put(self, row, cleaned):
+        pass
+
+
+class CountingAllocator:
+    """Stands in for the DB-backed IdAllocator."""
+
+    def take(self, count):
+        return [f"A{900000 + k}" for k in range(count)]
+
+    def observe(self, top):
+        pass
+
+
+def make_frame(n: int, seed: int = 7) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "applicant_id":    [f"A{100000 + i}" for i in range(n)],
+        "applicant_name":  ["Ravi Kumar"] * n,
+        "phone_number":    ["9876543210"] * n,
+        # swapped with loan_amount on every row
+        "email":           [str(rng.choice([600000, 750000, 900000])) for _ in range(n)],
+        "aadhaar_number":  ["123412341234"] * n,
+        "pan_number":      ["ABCDE1234F"] * n,
+        "loan_amount":     [f"row{i}@example.com" for i in range(n)],
+        "loan_purpose":    ["car"] * n,
+        "employment_type": ["salaried"] * n,
+        "monthly_income":  [None] * n,
+    }, dtype=object)
+
+
+def run(df, sample, latency):
+    calls = [0]
+    lock = threading.Lock()
+
+    def repair(row):
+        time.sleep(latency)
+        with lock:
+            calls[0] += 1
+        return {**row, "email": row["loan_amount"], "loan_amount": row["email"]}
+
+    main_llm.call_llm_repair = repair
+    main_llm.PERMUTATION_SAMPLE = sample
+    t = time.perf_counter()
+    out, _, _, _, summary = main_llm.run_pipeline(df.copy())
+    return out, calls[0], time.perf_counter() - t, summary["triage"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    ap.add_argument("--sample", type=int, default=main_llm.PERMUTATION_SAMPLE)
+    ap.add_argument("--llm-latency", type=float, default=0.02)
+    args = ap.parse_args()
+
+    main_llm.call_llm_mapping = lambda cols, fields, rows: {}
+    main_llm.repair_cache = NoCache()
+    main_llm.id_allocator = CountingAllocator()
+
+    print(f"sample={args.sample}  llm latency={args.llm_latency * 1000:.0f}ms  workers={main_llm.REPAIR_MAX_WORKERS}")
+    print(f"{'rows':>8}  {'per-row calls':>13}  {'sampled calls':>13}  {'per-row':>8}  {'sampled':>8}  {'speedup':>8}")
+    for n in args.sizes:
+        df = make_frame(n)
+        slow, slow_calls, t_slow, _ = run(df, 0, args.llm_latency)
+        fast, fast_calls, t_fast, triage = run(df, args.sample, args.llm_latency)
+        pd.testing.assert_frame_equal(slow, fast)
+        assert triage["permuted"] + triage["sent_to_llm"] == n, triage
+        print(f"{n:>8,}  {slow_calls:>13,}  {fast_calls:>13,}  {t_slow:>7.2f}s  {t_fast:>7.2f}s  {t_slow / t_fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+upsert throughput: chunked INSERT ... ON DUPLICATE KEY UPDATE vs the original
+per-row SELECT COUNT(*) + INSERT/UPDATE loop.
+
+Each size is run twice per implementation against an empty table: once all
+inserts, once all updates. Defaults to a throwaway SQLite file; pass --url to
+point at a real MySQL database (loan_applicants is emptied before each run).
+
+    python benchmarks/bench_upsert.py --sizes 1000 10000 50000
+    python benchmarks/bench_upsert.py --url mysql+pymysql://user:pw@localhost/bench_db
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+
+import main_llm
+
+
+def is_null(v):
+    return str(v).strip() in ("nan", "None", "NaT", "none", "null", "")
+
+
+def upsert_rowwise(df):
+    """The original row-by-row implementation, kept here as the baseline."""
+    ins, upd = 0, 0
+    with main_llm.engine.begin() as conn:
+        for _, r in df.iterrows():
+            d = {k: (None if is_null(str(v)) else v) for k, v in r.to_dict().items()}
+            exists = conn.execute(
+                text("SELECT COUNT(*) FROM loan_applicants WHERE applicant_id=:id"),
+                {"id": d["applicant_id"]}
+            ).scalar()
+            if exists:
+                conn.execute(text("""
+                UPDATE loan_applicants SET
+                  applicant_name=:applicant_name, phone_number=:phone_number,
+                  email=:email, aadhaar_number=:aadhaar_number,
+                  pan_number=:pan_number, loan_amount=:loan_amount,
+                  loan_purpose=:loan_purpose, employment_type=:employment_type,
+                  monthly_income=:monthly_income
+                WHERE applicant_id=:applicant_id
+                """), d)
+                upd += 1
+            else:
+                conn.execute(text("""
+                INSERT INTO loan_applicants (
+                  applicant_id, applicant_name, phone_number, email,
+                  aadhaar_number, pan_number, loan_amount,
+                  loan_purpose, employment_type, monthly_income, created_at
+                ) VALUES (
+                  :applicant_id, :applicant_name, :phone_number, :email,
+                  :aadhaar_number, :pan_number, :loan_amount,
+                  :loan_purpose, :employment_type, :monthly_income, NOW()
+                )
+                """), d)
+                ins += 1
+    return ins, upd
+
+
+def make_frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "applicant_id":    [f"A{100000 + i}" for i in range(n)],
+        "applicant_name":  ["Ravi Kumar"] * n,
+        "phone_number":    ["9876543210"] * n,
+        "email":           ["ravi@example.com"] * n,
+        "aadhaar_number":  ["123412341234"] * n,
+        "pan_number":      ["ABCDE1234F"] * n,
+        "loan_amount":     ["2000000"] * n,
+        "loan_purpose":    ["Car"] * n,
+        "employment_type": ["Salaried"] * n,
+        "monthly_income":  ["50000"] * n,
+    })
+
+
+def reset_table():
+    main_llm.migrate()
+    with main_llm.engine.begin() as conn:
+        conn.execute(text("DELETE FROM loan_applicants"))
+    main_llm.rebuild_stats()
+
+
+def timed(fn, df):
+    t = time.perf_counter()
+    counts = fn(df)
+    return counts, time.perf_counter() - t
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    ap.add_argument("--url", default=None)
+    args = ap.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp(prefix='loansense-bench-')}/upsert.db"
+    main_llm.engine = create_engine(url)
+    if main_llm.engine.dialect.name == "sqlite":
+        @event.listens_for(main_llm.engine, "connect")
+        def _now(dbapi_conn, _):
+            dbapi_conn.create_function("NOW", 0, lambda: datetime.datetime.now().isoformat(" "))
+
+    print(f"{main_llm.engine.dialect.name}  chunk={main_llm.UPSERT_CHUNK_SIZE}")
+    print(f"{'rows':>8}  {'mode':<7}  {'row loop rows/s':>16}  {'bulk rows/s':>12}  {'speedup':>8}")
+    for n in args.sizes:
+        df = make_frame(n)
+        results = {}
+        for name, fn in (("loop", upsert_rowwise), ("bulk", main_llm.upsert)):
+            reset_table()
+            first, t_ins = timed(fn, df)
+            second, t_upd = timed(fn, df)
+            assert first == (n, 0) and second == (0, n), (name, first, second)
+            results[name] = (t_ins, t_upd)
+        for mode, k in (("insert", 0), ("update", 1)):
+            loop_rps = n / results["loop"][k]
+            bulk_rps = n / results["bulk"][k]
+            print(f"{n:>8,}  {mode:<7}  {loop_rps:>16,.0f}  {bulk_rps:>12,.0f}  {bulk_rps / loop_rps:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
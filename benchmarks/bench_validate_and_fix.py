@@ -0,0 +1,158 @@
+"""
+validate_and_fix: column-wise implementation vs the original per-row loop.
+
+Builds a frame of mixed valid/invalid values, runs both implementations on
+identical copies, checks they agree cell for cell and prints rows/sec.
+
+    python benchmarks/bench_validate_and_fix.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+
+import main_llm
+from main_llm import EMPLOYMENT_TYPES, LOAN_PURPOSES
+
+
+# The original per-value validators, which main_llm's FIELD_CHECKS replaced
+def valid_id(v):
+    return bool(re.match(r"^A\d+$", str(v).strip()))
+
+
+def valid_email(v):
+    return bool(re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]{2,}$", str(v).strip()))
+
+
+def valid_phone(v):
+    s = str(v).strip()
+    return s.isdigit() and len(s) == 10 and s[0] in "6789"
+
+
+def valid_aadhaar(v):
+    s = str(v).strip()
+    return s.isdigit() and len(s) == 12
+
+
+def valid_pan(v):
+    return bool(re.match(r"^[A-Z]{5}[0-9]{4}[A-Z]$", str(v).strip().upper()))
+
+
+def valid_loan_amount(v):
+    try:
+        return 500000 <= int(str(v).strip()) <= 10000000
+    except:
+        return False
+
+
+def valid_monthly_income(v):
+    try:
+        return 25000 <= int(str(v).strip()) <= 1000000
+    except:
+        return False
+
+
+def valid_name(v):
+    parts = str(v).strip().split()
+    return (
+        len(parts) >= 1
+        and bool(re.match(r"^[A-Za-z ]+$", str(v).strip()))
+        and all(len(p) >= 2 for p in parts)
+    )
+
+
+class CountingAllocator:
+    """Stands in for the DB-backed IdAllocator so both runs get the same IDs."""
+
+    def __init__(self):
+        self.n = 900000
+
+    def take(self, count):
+        ids = [f"A{self.n + k + 1}" for k in range(count)]
+        self.n += count
+        return ids
+
+    def observe(self, top):
+        pass
+
+
+def validate_and_fix_loop(df: pd.DataFrame) -> pd.DataFrame:
+    """The original row-by-row implementation, kept here as the baseline."""
+    for i in df.index:
+        aid = str(df.at[i, "applicant_id"]).strip()
+        if not valid_id(aid):
+            df.at[i, "applicant_id"] = main_llm.id_allocator.take(1)[0]
+        if not valid_phone(str(df.at[i, "phone_number"])):
+            df.at[i, "phone_number"] = None
+        if not valid_email(str(df.at[i, "email"])):
+            df.at[i, "email"] = None
+        if not valid_aadhaar(str(df.at[i, "aadhaar_number"])):
+            df.at[i, "aadhaar_number"] = None
+        pan = str(df.at[i, "pan_number"]).strip().upper()
+        df.at[i, "pan_number"] = pan if valid_pan(pan) else None
+        if not valid_loan_amount(str(df.at[i, "loan_amount"])):
+            df.at[i, "loan_amount"] = None
+        if not valid_monthly_income(str(df.at[i, "monthly_income"])):
+            df.at[i, "monthly_income"] = None
+        lp = str(df.at[i, "loan_purpose"]).strip().lower()
+        df.at[i, "loan_purpose"] = lp.title() if lp in LOAN_PURPOSES else None
+        et = str(df.at[i, "employment_type"]).strip().lower()
+        df.at[i, "employment_type"] = et.title() if et in EMPLOYMENT_TYPES else None
+        if not valid_name(str(df.at[i, "applicant_name"])):
+            df.at[i, "applicant_name"] = None
+    return df
+
+
+CHOICES = {
+    "applicant_id":    ["A101", " A2002 ", "B12", None, "A"],
+    "applicant_name":  ["Ravi Kumar", "R Kumar", "Ravi2", None, "Asha"],
+    "phone_number":    ["9876543210", "1234567890", "98765", None, " 7000000000 "],
+    "email":           ["ravi@x.com", "ravi@x", "not an email", None],
+    "aadhaar_number":  ["123412341234", "1234", None, "12341234123a"],
+    "pan_number":      ["ABCDE1234F", "abcde1234f", "ABCD1234F", None],
+    "loan_amount":     ["2000000", "100", "99999999", None, "750000"],
+    "loan_purpose":    ["car", " Home Renovation ", "holiday", None],
+    "employment_type": ["salaried", "Self Employed", "retired", None],
+    "monthly_income":  ["50000", "10", "2000000", None, "+30000"],
+}
+
+
+def make_frame(n: int, seed: int = 7) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({f: [rng.choice(v) for _ in range(n)] for f, v in CHOICES.items()}, dtype=object)
+
+
+def run(fn, df):
+    main_llm.id_allocator = CountingAllocator()
+    t = time.perf_counter()
+    out = fn(df.copy())
+    return out, time.perf_counter() - t
+
+
+def normalise(df):
+    return df.astype(object).where(df.notna(), None)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = ap.parse_args()
+
+    print(f"{'rows':>10}  {'loop':>10}  {'vectorized':>10}  {'speedup':>8}")
+    for n in args.sizes:
+        df = make_frame(n)
+        slow, t_loop = run(validate_and_fix_loop, df)
+        fast, t_vec = run(main_llm.validate_and_fix, df)
+        pd.testing.assert_frame_equal(normalise(slow), normalise(fast))
+        print(f"{n:>10,}  {t_loop:>9.2f}s  {t_vec:>9.3f}s  {t_loop / t_vec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
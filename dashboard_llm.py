@@ -3,10 +3,28 @@ import requests
 import pandas as pd
 from io import BytesIO
 import json
+import tempfile
 import time
 
 FASTAPI_URL = "http://localhost:8000"
 
+# Seconds a health check / stats payload is reused across reruns
+HEALTH_TTL   = 15
+STATS_TTL    = 60
+RECORDS_TTL  = 30
+RECORDS_PAGE = 200
+
+# Seconds the dashboard polls a background job before giving up on it
+JOB_TIMEOUT = 30 * 60
+
+# Exports bigger than this are spooled to disk while they download from the API
+EXPORT_SPOOL_BYTES = 16 * 1024 * 1024
+EXPORT_MIME = {
+    "xlsx":    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv":     "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
 # ─────────────────────────────────────────────
 # PAGE CONFIG
 # ─────────────────────────────────────────────
@@ -490,6 +508,57 @@ def download_excel(df: pd.DataFrame, label: str, filename: str):
         use_container_width=True
     )
 
+def peek_file(uploaded_file, n=3) -> pd.DataFrame:
+    """First rows of an uploaded xlsx/csv/parquet file, without reading all of it."""
+    name = uploaded_file.name.lower()
+    if name.endswith(".csv"):
+        return pd.read_csv(uploaded_file, nrows=n, dtype=str)
+    if name.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return next(pq.ParquetFile(uploaded_file).iter_batches(batch_size=n)).to_pandas()
+    return pd.read_excel(uploaded_file, nrows=n)
+
+def run_job(files, commit=False):
+    """
+    Queue the file as a background job and poll it, showing live progress.
+    Gives up after JOB_TIMEOUT seconds or when the API stops answering; the
+    returned job then has status "error" and a message naming the job id.
+    """
+    try:
+        res = requests.post(f"{FASTAPI_URL}/jobs/", files=files,
+                            params={"commit": commit}, timeout=60)
+        job_id = res.json().get("job_id") if res.status_code == 200 else None
+    except (requests.RequestException, ValueError):
+        return None
+    if not job_id:
+        return None
+
+    bar = st.progress(0.0, text="Queued…")
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while True:
+        if time.monotonic() > deadline:
+            bar.empty()
+            return {"status": "error", "message": f"Job {job_id} still running after {JOB_TIMEOUT}s — stopped waiting"}
+        try:
+            r = requests.get(f"{FASTAPI_URL}/jobs/{job_id}", timeout=10)
+            r.raise_for_status()
+            job = r.json()
+        except (requests.RequestException, ValueError) as e:
+            bar.empty()
+            return {"status": "error", "message": f"Lost track of job {job_id}: {e}"}
+        total = job.get("rows_total") or 0
+        done  = job.get("rows_done") or 0
+        live  = (job.get("quality") or {}).get("overall")
+        text  = f"{job.get('stage', '…')} — {done}/{total} rows"
+        if live is not None:
+            text += f" · quality {live}%"
+        bar.progress(min(done / total, 1.0) if total else 0.0, text=text)
+        if job.get("status") in ("done", "failed", "error"):
+            bar.empty()
+            return job
+        time.sleep(1)
+
+@st.cache_data(ttl=HEALTH_TTL, show_spinner=False)
 def check_api():
     try:
         r = requests.get(f"{FASTAPI_URL}/", timeout=3)
@@ -497,14 +566,58 @@ def check_api():
     except:
         return False
 
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def fetch_stats():
+    # Raises on failure so errors aren't cached
+    r = requests.get(f"{FASTAPI_URL}/stats/", timeout=5)
+    r.raise_for_status()
+    data = r.json()
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    return data
+
 def get_stats():
     try:
-        r = requests.get(f"{FASTAPI_URL}/stats/", timeout=5)
-        if r.status_code == 200:
-            return r.json()
+        return fetch_stats()
     except:
-        pass
-    return None
+        return None
+
+@st.cache_data(ttl=RECORDS_TTL, show_spinner=False)
+def fetch_records(cursor, filters):
+    """One page of /records/; `filters` is a tuple of (name, value) pairs."""
+    params = {"limit": RECORDS_PAGE, **dict(filters)}
+    if cursor:
+        params["cursor"] = cursor
+    r = requests.get(f"{FASTAPI_URL}/records/", params=params, timeout=30)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("status") == "error":
+        raise RuntimeError(data.get("message"))
+    return data
+
+def export_file(fmt, filters):
+    """
+    Stream /export/ from the API into a temp file for st.download_button,
+    so browsers only ever talk to the dashboard, never to the API.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    with requests.get(f"{FASTAPI_URL}/export/", params={"format": fmt, **dict(filters)},
+                      stream=True, timeout=(10, 300)) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=1024 * 1024):
+            out.write(chunk)
+    out.seek(0)
+    return out
+
+def reset_db_pages():
+    st.session_state.db_cursors = [None]
+
+def next_db_page(cursor):
+    st.session_state.db_cursors.append(cursor)
+
+def prev_db_page():
+    if len(st.session_state.db_cursors) > 1:
+        st.session_state.db_cursors.pop()
 
 
 # ─────────────────────────────────────────────
@@ -577,12 +690,18 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ─── Session State ───
-if "validated_rows" not in st.session_state:
-    st.session_state.validated_rows = None
+if "validation_id" not in st.session_state:
+    st.session_state.validation_id = None
+if "validated_total" not in st.session_state:
+    st.session_state.validated_total = 0
 if "validated_quality" not in st.session_state:
     st.session_state.validated_quality = None
 if "validated_mapping" not in st.session_state:
     st.session_state.validated_mapping = None
+if "db_cursors" not in st.session_state:
+    st.session_state.db_cursors = [None]   # cursor of every page visited so far
+if "db_loaded" not in st.session_state:
+    st.session_state.db_loaded = False
 
 # ─── TABS ───
 tab_ingest, tab_stats, tab_db = st.tabs(["⚡  Ingest", "📊  Analytics", "🗄  Database"])
@@ -602,8 +721,8 @@ with tab_ingest:
     """, unsafe_allow_html=True)
 
     uploaded_file = st.file_uploader(
-        "Drop your Excel file here or click to browse",
-        type=["xlsx"],
+        "Drop your Excel, CSV or Parquet file here or click to browse",
+        type=["xlsx", "csv", "parquet"],
         label_visibility="collapsed"
     )
 
@@ -620,7 +739,7 @@ with tab_ingest:
 
         # Quick peek
         try:
-            peek_df = pd.read_excel(uploaded_file, nrows=3)
+            peek_df = peek_file(uploaded_file)
             uploaded_file.seek(0)
             st.markdown(f"""
             <div style="font-family:'DM Mono',monospace;font-size:11px;color:#6b7fa3;
@@ -647,7 +766,7 @@ with tab_ingest:
     with col_v:
         if st.button("🔍  Validate & Preview", use_container_width=True):
             if not uploaded_file:
-                st.error("Please upload an Excel file first.")
+                st.error("Please upload a file first.")
             elif not api_ok:
                 st.error("FastAPI server is offline. Please start it first.")
             else:
@@ -656,18 +775,23 @@ with tab_ingest:
                     time.sleep(0.3)
 
                 with st.spinner("🔧 API 2: Unjumbling rows with LLM..."):
-                    files = {"file": ("file.xlsx", uploaded_file.getvalue(),
-                             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
-                    res = requests.post(f"{FASTAPI_URL}/validate/", files=files, timeout=300)
+                    files = {"file": (uploaded_file.name, uploaded_file.getvalue(),
+                             uploaded_file.type or "application/octet-stream")}
+                    job = run_job(files)
 
                 render_pipeline_status(3)
 
-                if res.status_code == 200:
-                    data = res.json()
+                if job and job.get("status") == "done":
+                    data = {
+                        **(job.get("result") or {}),
+                        "quality": job.get("quality") or {},
+                        "errors":  job.get("errors") or [],
+                    }
                     st.success(f"✅ Validation complete — {data.get('total_rows', 0)} rows processed")
 
-                    # Store in session state for direct upload
-                    st.session_state.validated_rows    = data.get("preview", [])
+                    # Full result is staged server-side; keep only its id
+                    st.session_state.validation_id     = data.get("validation_id")
+                    st.session_state.validated_total   = data.get("total_rows", 0)
                     st.session_state.validated_quality = data.get("quality", {})
                     st.session_state.validated_mapping = data.get("mapping", {})
 
@@ -709,6 +833,12 @@ with tab_ingest:
 
                     with r1:
                         render_mapping(mapping)
+                        ms = data.get("mapping_stats") or {}
+                        if ms.get("columns"):
+                            st.caption(
+                                f"{ms['resolved_locally']} of {ms['columns']} columns matched locally "
+                                f"({ms['local_ratio']:.0%}) · {ms['sent_to_llm']} sent to the mapping LLM"
+                            )
 
                     with r2:
                         render_quality_panel(quality)
@@ -762,13 +892,13 @@ with tab_ingest:
                             st.success("🎉 No repair errors — all rows processed cleanly!")
                 else:
                     st.error("❌ Validation failed")
-                    st.code(res.text)
+                    st.code((job or {}).get("message") or "Job could not be started")
 
     # ── UPLOAD TO DB ──
     with col_u:
         # Show whether validated data is ready
-        if st.session_state.validated_rows:
-            n = len(st.session_state.validated_rows)
+        if st.session_state.validation_id:
+            n = st.session_state.validated_total
             st.markdown(f"""
             <div style="display:flex;align-items:center;gap:10px;padding:10px 14px;
                         background:rgba(0,229,160,0.08);border:1px solid rgba(0,229,160,0.2);
@@ -791,26 +921,25 @@ with tab_ingest:
         if st.button("🚀  Upload to Database", use_container_width=True):
             if not api_ok:
                 st.error("FastAPI server is offline.")
-            elif not st.session_state.validated_rows:
+            elif not st.session_state.validation_id:
                 st.warning("Please run **Validate & Preview** first — no validated data found.")
             else:
                 with st.spinner("💾 Saving validated rows to DB..."):
                     res = requests.post(
                         f"{FASTAPI_URL}/upload-validated/",
-                        json={
-                            "rows":    st.session_state.validated_rows,
-                            "quality": st.session_state.validated_quality or {}
-                        },
-                        timeout=60
+                        json={"validation_id": st.session_state.validation_id},
+                        timeout=600
                     )
 
-                if res.status_code == 200:
+                if res.status_code == 200 and res.json().get("status") == "success":
                     data = res.json()
                     quality = data.get("quality", {})
                     overall = quality.get("overall", 0)
 
                     # Clear session after successful upload
-                    st.session_state.validated_rows    = None
+                    fetch_stats.clear()
+                    st.session_state.validation_id     = None
+                    st.session_state.validated_total   = 0
                     st.session_state.validated_quality = None
                     st.session_state.validated_mapping = None
 
@@ -857,7 +986,8 @@ with tab_stats:
     """, unsafe_allow_html=True)
 
     if st.button("🔄  Refresh Stats", use_container_width=False):
-        st.rerun()
+        fetch_stats.clear()
+        check_api.clear()
 
     stats = get_stats()
 
@@ -982,27 +1112,72 @@ with tab_db:
     </div>
     """, unsafe_allow_html=True)
 
+    _stats = get_stats() or {}
+    purposes = ["All"] + sorted(p["purpose"] for p in _stats.get("by_purpose", []) if p["purpose"])
+    emp_types = ["All"] + sorted(e["type"] for e in _stats.get("by_employment", []) if e["type"])
+
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        f_purpose = st.selectbox("Loan purpose", purposes, on_change=reset_db_pages)
+    with f2:
+        f_emp = st.selectbox("Employment type", emp_types, on_change=reset_db_pages)
+    with f3:
+        f_min = st.number_input("Min monthly income", min_value=0, value=0, step=5000, on_change=reset_db_pages)
+    with f4:
+        f_max = st.number_input("Max monthly income (0 = any)", min_value=0, value=0, step=5000, on_change=reset_db_pages)
+
+    filters = []
+    if f_purpose != "All":
+        filters.append(("purpose", f_purpose))
+    if f_emp != "All":
+        filters.append(("employment_type", f_emp))
+    if f_min:
+        filters.append(("min_income", f_min))
+    if f_max:
+        filters.append(("max_income", f_max))
+    filters = tuple(filters)
+
     if st.button("🔄  Fetch Records", use_container_width=False):
+        fetch_records.clear()
+        reset_db_pages()
+        st.session_state.db_loaded = True
+
+    if st.session_state.db_loaded:
         try:
-            from sqlalchemy import create_engine, text
-            from dotenv import load_dotenv
-            import os
-            load_dotenv()
-            _url = f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-            _eng = create_engine(_url)
-            with _eng.connect() as conn:
-                df = pd.read_sql("SELECT * FROM loan_applicants ORDER BY created_at DESC LIMIT 200", conn)
+            page_no = len(st.session_state.db_cursors)
+            page = fetch_records(st.session_state.db_cursors[-1], filters)
+            df = pd.DataFrame(page["records"])
 
             st.markdown(f"""
             <div style="font-family:'DM Mono',monospace;font-size:12px;color:#6b7fa3;
                         margin-bottom:10px;text-transform:uppercase;letter-spacing:0.06em">
-                Showing {len(df)} records (latest 200)
+                Page {page_no} · {len(df)} records · newest first
             </div>
             """, unsafe_allow_html=True)
             st.dataframe(df, use_container_width=True, height=480)
 
-            # Download
-            download_excel(df, "⬇️  Export All Records", "loan_applicants_db.xlsx")
+            n1, n2, _ = st.columns([1, 1, 4])
+            with n1:
+                st.button("◀  Previous", disabled=page_no == 1,
+                          on_click=prev_db_page, use_container_width=True)
+            with n2:
+                st.button("Next  ▶", disabled=not page["next_cursor"],
+                          on_click=next_db_page, args=(page["next_cursor"],),
+                          use_container_width=True)
+
+            # Download — streamed from the backend only when clicked
+            e1, e2 = st.columns([1, 3])
+            with e1:
+                fmt = st.selectbox("Export format", list(EXPORT_MIME), label_visibility="collapsed")
+            with e2:
+                st.download_button(
+                    "⬇️  Export All Matching Records",
+                    data=lambda: export_file(fmt, filters),
+                    file_name=f"loan_applicants.{fmt}",
+                    mime=EXPORT_MIME[fmt],
+                    on_click="ignore",
+                    use_container_width=True
+                )
 
         except Exception as e:
-            st.error(f"Could not connect to DB: {e}")
\ No newline at end of file
+            st.error(f"Could not load records: {e}")
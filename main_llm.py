@@ -1,15 +1,53 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Body
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pa_csv
+import openpyxl
 import requests
 import json
+import csv
+import io
 import re
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import shutil
+import itertools
+import tempfile
+import uuid
+from collections import OrderedDict, deque
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from decimal import Decimal, InvalidOperation
+import base64
+import difflib
+import hashlib
+import random
+import sqlite3
+import threading
+import time
 import os
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Startup hooks are defined further down
+    migrate()
+    resume_jobs()
+    job_reaper.start()
+    yield
+    job_reaper.stop()
+    job_pool.shutdown(wait=False)
+    request_pool.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 # ================= DATABASE =================
 DATABASE_URL = f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
@@ -19,6 +57,84 @@ MAPPING_API_URL = os.getenv("API_URL")          # Field mapping LLM
 REPAIR_API_URL  = os.getenv("REPAIR_API_URL")   # Unjumbling LLM (Langfuse/sneha1)
 TOKEN           = os.getenv("DVARA_TOKEN")
 
+# Max repair calls in flight per pipeline run
+REPAIR_MAX_WORKERS = int(os.getenv("REPAIR_MAX_WORKERS", "8"))
+# Rows packed into one repair request (1 = one row per call)
+REPAIR_BATCH_SIZE  = int(os.getenv("REPAIR_BATCH_SIZE", "1"))
+
+# Learned column shift: with at least PERMUTATION_MIN_ROWS rows left for the LLM,
+# repair a PERMUTATION_SAMPLE-row sample first and apply the shift it shows to the rest
+PERMUTATION_SAMPLE        = int(os.getenv("PERMUTATION_SAMPLE", "20"))
+PERMUTATION_MIN_ROWS      = int(os.getenv("PERMUTATION_MIN_ROWS", "100"))
+PERMUTATION_MIN_AGREEMENT = float(os.getenv("PERMUTATION_MIN_AGREEMENT", "0.8"))
+
+# LLM HTTP client — pooling, retries, timeouts, circuit breaker
+LLM_POOL_SIZE      = int(os.getenv("LLM_POOL_SIZE", str(max(REPAIR_MAX_WORKERS, 10))))
+LLM_MAX_RETRIES    = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE   = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX    = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+MAPPING_TIMEOUT    = float(os.getenv("MAPPING_TIMEOUT", "60"))
+REPAIR_TIMEOUT     = float(os.getenv("REPAIR_TIMEOUT", "60"))
+BREAKER_WINDOW     = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS  = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN   = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# Process-wide rate limits (requests/sec ceiling per endpoint, adapted down on 429)
+MAPPING_RATE_LIMIT   = float(os.getenv("MAPPING_RATE_LIMIT", "5"))
+REPAIR_RATE_LIMIT    = float(os.getenv("REPAIR_RATE_LIMIT", "20"))
+LLM_RATE_MIN         = float(os.getenv("LLM_RATE_MIN", "0.5"))
+LLM_RATE_BURST       = int(os.getenv("LLM_RATE_BURST", "10"))
+LLM_THROTTLE_RETRIES = int(os.getenv("LLM_THROTTLE_RETRIES", "10"))
+
+# Header match score (0-1) a column needs before the local resolver maps it without the LLM
+LOCAL_MAPPING_MIN_SCORE = float(os.getenv("LOCAL_MAPPING_MIN_SCORE", "0.8"))
+
+# Rows per multi-row INSERT ... ON DUPLICATE KEY UPDATE
+UPSERT_CHUNK_SIZE = int(os.getenv("UPSERT_CHUNK_SIZE", "1000"))
+
+# Applicant IDs reserved from the DB sequence per round-trip
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "100"))
+
+# Records endpoint page size (default and hard cap)
+RECORDS_PAGE_SIZE = int(os.getenv("RECORDS_PAGE_SIZE", "200"))
+RECORDS_PAGE_MAX  = int(os.getenv("RECORDS_PAGE_MAX", "1000"))
+
+# Rows fetched per server-side cursor round-trip during /export/
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# Seconds a /stats/ payload is served from memory (upserts invalidate it early)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+
+# Seconds a validated file stays staged for /upload-validated/
+STAGING_TTL = int(os.getenv("STAGING_TTL", str(24 * 3600)))
+
+# Local state (caches, jobs etc.) lives here
+STATE_DIR = os.getenv("STATE_DIR", ".loansense")
+
+# Job files at least this big are streamed STREAM_CHUNK_ROWS rows at a time
+STREAM_MIN_BYTES  = int(os.getenv("STREAM_MIN_BYTES", str(2 * 1024 * 1024)))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "5000"))
+
+# Minimum seconds between live progress/quality updates while rows are repaired
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
+
+# Sheets of a multi-sheet workbook processed at once
+SHEET_WORKERS = int(os.getenv("SHEET_WORKERS", "4"))
+
+# Background ingestion jobs running at once
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Seconds a job's owner may go without a heartbeat before another worker takes the job over
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))
+# Threads serving blocking work for the async request endpoints
+REQUEST_WORKERS = int(os.getenv("REQUEST_WORKERS", "4"))
+
+# Repair cache — bump REPAIR_PROMPT_VERSION whenever the Langfuse prompt changes
+REPAIR_PROMPT_VERSION     = os.getenv("REPAIR_PROMPT_VERSION", "1")
+REPAIR_CACHE_MEMORY_SIZE  = int(os.getenv("REPAIR_CACHE_MEMORY_SIZE", "10000"))
+REPAIR_CACHE_DISK_SIZE    = int(os.getenv("REPAIR_CACHE_DISK_SIZE", "1000000"))
+REPAIR_CACHE_TTL          = int(os.getenv("REPAIR_CACHE_TTL", str(30 * 24 * 3600)))
+
 # ================= CONTROLLED LISTS =================
 LOAN_PURPOSES = ["education", "home renovation", "car", "business", "personal", "medical"]
 EMPLOYMENT_TYPES = ["salaried", "self employed", "unemployed"]
@@ -30,90 +146,513 @@ DB_FIELDS = [
 ]
 
 # =========================================================
-# CREATE TABLE
-# =========================================================
-def create_table():
-    query = """
-    CREATE TABLE IF NOT EXISTS loan_applicants (
-        applicant_id    VARCHAR(50)    PRIMARY KEY,
-        applicant_name  VARCHAR(255),
-        phone_number    VARCHAR(20),
-        email           VARCHAR(255),
-        aadhaar_number  VARCHAR(20),
-        pan_number      VARCHAR(20),
-        loan_amount     DECIMAL(12,2),
-        loan_purpose    VARCHAR(255),
-        employment_type VARCHAR(100),
-        monthly_income  DECIMAL(12,2),
-        created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+# SCHEMA MIGRATIONS
+# Applied once at startup (see lifespan); request paths never run DDL.
+# Append new steps — never edit or reorder ones that have shipped.
+# =========================================================
+# Recomputes applicant_stats from loan_applicants (NULL buckets are stored as '')
+STATS_REBUILD_SQL = [
+    "DELETE FROM applicant_stats",
+    """INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+       SELECT 'all', '', COUNT(*), 0 FROM loan_applicants""",
+    """INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+       SELECT 'purpose', COALESCE(loan_purpose, ''), COUNT(*), 0
+       FROM loan_applicants GROUP BY COALESCE(loan_purpose, '')""",
+    """INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+       SELECT 'employment', COALESCE(employment_type, ''), COUNT(*), 0
+       FROM loan_applicants GROUP BY COALESCE(employment_type, '')""",
+    """INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+       SELECT 'loan_amount', '', COUNT(loan_amount), COALESCE(SUM(loan_amount), 0)
+       FROM loan_applicants""",
+    """INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+       SELECT 'monthly_income', '', COUNT(monthly_income), COALESCE(SUM(monthly_income), 0)
+       FROM loan_applicants""",
+]
+
+def seed_id_sequence(conn):
+    """Start the applicant_id sequence above every numeric ID already stored (no-op once seeded)."""
+    if conn.execute(text("SELECT 1 FROM id_sequences WHERE name = 'applicant_id'")).first():
+        return
+    top = 100
+    for (aid,) in conn.execute(text(
+        "SELECT applicant_id FROM loan_applicants WHERE applicant_id LIKE 'A%'"
+    )):
+        if re.match(r"^A[0-9]+$", aid):
+            top = max(top, int(aid[1:]))
+    conn.execute(
+        text("INSERT INTO id_sequences (name, next_val) VALUES ('applicant_id', :next_val)"),
+        {"next_val": top + 1}
     )
+
+def create_index(name, table, columns):
     """
+    Migration step creating an index unless it already exists. MySQL DDL
+    commits on its own, so a migration interrupted halfway leaves some of
+    its indexes behind; the rerun must skip them.
+    """
+    def step(conn):
+        if conn.dialect.name == "mysql":
+            exists = conn.execute(text("""
+                SELECT 1 FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = :t AND index_name = :i
+                LIMIT 1
+            """), {"t": table, "i": name}).first()
+            if not exists:
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+        else:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    return step
+
+# A step is a SQL string or a callable taking the migration connection
+MIGRATIONS = [
+    (1, "create loan_applicants", [
+        """
+        CREATE TABLE IF NOT EXISTS loan_applicants (
+            applicant_id    VARCHAR(50)    PRIMARY KEY,
+            applicant_name  VARCHAR(255),
+            phone_number    VARCHAR(20),
+            email           VARCHAR(255),
+            aadhaar_number  VARCHAR(20),
+            pan_number      VARCHAR(20),
+            loan_amount     DECIMAL(12,2),
+            loan_purpose    VARCHAR(255),
+            employment_type VARCHAR(100),
+            monthly_income  DECIMAL(12,2),
+            created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "create id_sequences", [
+        """
+        CREATE TABLE IF NOT EXISTS id_sequences (
+            name     VARCHAR(50) PRIMARY KEY,
+            next_val BIGINT      NOT NULL
+        )
+        """,
+    ]),
+    (3, "secondary indexes for viewer, stats and lookups", [
+        create_index("ix_applicants_created", "loan_applicants", "created_at, applicant_id"),
+        create_index("ix_applicants_purpose", "loan_applicants", "loan_purpose"),
+        create_index("ix_applicants_employment", "loan_applicants", "employment_type"),
+        create_index("ix_applicants_pan", "loan_applicants", "pan_number"),
+        create_index("ix_applicants_aadhaar", "loan_applicants", "aadhaar_number"),
+        create_index("ix_applicants_phone", "loan_applicants", "phone_number"),
+    ]),
+    (4, "applicant_stats summary table", [
+        """
+        CREATE TABLE IF NOT EXISTS applicant_stats (
+            dimension VARCHAR(32)   NOT NULL,
+            bucket    VARCHAR(255)  NOT NULL,
+            cnt       BIGINT        NOT NULL DEFAULT 0,
+            total     DECIMAL(20,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, bucket)
+        )
+        """,
+        *STATS_REBUILD_SQL,
+    ]),
+    (5, "filter + keyset indexes for the records endpoint", [
+        create_index("ix_applicants_purpose_created", "loan_applicants", "loan_purpose, created_at, applicant_id"),
+        create_index("ix_applicants_employment_created", "loan_applicants", "employment_type, created_at, applicant_id"),
+    ]),
+    (6, "seed the applicant_id sequence", [
+        seed_id_sequence,
+    ]),
+]
+
+def migrate():
+    """Bring the schema up to the latest MIGRATIONS version; safe to call on every boot."""
+    mysql = engine.dialect.name == "mysql"
+    locked = False
     with engine.connect() as conn:
-        conn.execute(text(query))
-        conn.commit()
+        if mysql:
+            # Only one uvicorn worker migrates at a time; 0 means another
+            # worker still holds the lock (keep waiting), NULL is an error
+            while not locked:
+                got = conn.execute(text("SELECT GET_LOCK('loansense_migrate', 60)")).scalar()
+                if got is None:
+                    raise RuntimeError("Could not take the migration lock")
+                locked = got == 1
+        try:
+            conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version     INT PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """))
+            conn.commit()
+            applied = {r[0] for r in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+            for version, description, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+                for stmt in statements:
+                    if callable(stmt):
+                        stmt(conn)
+                    else:
+                        conn.execute(text(stmt))
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                    {"v": version, "d": description}
+                )
+                conn.commit()
+                print(f"MIGRATION {version} applied: {description}")
+        finally:
+            if locked:
+                conn.execute(text("SELECT RELEASE_LOCK('loansense_migrate')"))
 
 # =========================================================
-# VALIDATORS
+# VALIDATORS (vectorized — whole Series at once)
 # =========================================================
-def valid_id(v):
-    return bool(re.match(r"^A\d+$", str(v).strip()))
+NULL_TOKENS = ["nan", "None", "NaT", "none", "null", ""]
+
+# Field rules as whole-string patterns (the original per-value validators
+# live on in benchmarks/bench_validate_and_fix.py as the baseline)
+ID_PATTERN      = r"A\d+"
+EMAIL_PATTERN   = r"[^@\s]+@[^@\s]+\.[^@\s]{2,}"
+PHONE_PATTERN   = r"[6-9]\d{9}"
+AADHAAR_PATTERN = r"\d{12}"
+PAN_PATTERN     = r"[A-Z]{5}[0-9]{4}[A-Z]"
+NAME_PATTERN    = r"[A-Za-z]{2,}(?: +[A-Za-z]{2,})*"
+INT_PATTERN     = r"[+-]?\d+"
+
+def as_clean_str(col: pd.Series) -> pd.Series:
+    """str(v).strip() for every cell; missing values become ""."""
+    return col.astype(object).where(col.notna(), "").astype(str).str.strip()
+
+def int_values(s: pd.Series) -> pd.Series:
+    """Numeric value of cells that int() would accept, NaN elsewhere."""
+    return pd.to_numeric(s.where(s.str.fullmatch(INT_PATTERN).fillna(False)), errors="coerce")
+
+# Each check takes an as_clean_str() Series and returns a boolean mask
+FIELD_CHECKS = {
+    "applicant_id":    lambda s: s.str.fullmatch(ID_PATTERN),
+    "applicant_name":  lambda s: s.str.fullmatch(NAME_PATTERN),
+    "phone_number":    lambda s: s.str.fullmatch(PHONE_PATTERN),
+    "email":           lambda s: s.str.fullmatch(EMAIL_PATTERN),
+    "aadhaar_number":  lambda s: s.str.fullmatch(AADHAAR_PATTERN),
+    "pan_number":      lambda s: s.str.upper().str.fullmatch(PAN_PATTERN),
+    "loan_amount":     lambda s: int_values(s).between(500000, 10000000),
+    "loan_purpose":    lambda s: s.str.lower().isin(LOAN_PURPOSES),
+    "employment_type": lambda s: s.str.lower().isin(EMPLOYMENT_TYPES),
+    "monthly_income":  lambda s: int_values(s).between(25000, 1000000),
+}
+
+def validity_masks(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Boolean frame (rows × DB_FIELDS): True where the value is present and
+    passes its field's validator. Shared by triage, validate_and_fix and
+    quality scoring so each cell is checked once per stage.
+    """
+    masks = {}
+    for field in DB_FIELDS:
+        if field not in df.columns:
+            masks[field] = np.zeros(len(df), dtype=bool)
+            continue
+        s = as_clean_str(df[field])
+        ok = FIELD_CHECKS[field](s).fillna(False).astype(bool)
+        masks[field] = (ok & ~s.isin(NULL_TOKENS)).to_numpy()
+    return pd.DataFrame(masks, index=df.index)
 
-def valid_email(v):
-    return bool(re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]{2,}$", str(v).strip()))
+# =========================================================
+# ID GENERATOR
+# =========================================================
+class IdAllocator:
+    """
+    Hands out applicant IDs from blocks reserved in the `id_sequences` table.
+    Each reservation is a single atomic UPDATE (row-locked on MySQL), so any
+    number of uvicorn workers can allocate at once without handing out the
+    same number twice; the reserved range is then served from memory.
+    The sequence row is seeded by migration 6. If a reservation fails the
+    error propagates; guessing a range locally could reuse stored IDs.
+    """
 
-def valid_phone(v):
-    s = str(v).strip()
-    return s.isdigit() and len(s) == 10 and s[0] in "6789"
+    NAME = "applicant_id"
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _update(self, conn, sql, params):
+        """Run an UPDATE on the sequence row."""
+        if not conn.execute(text(sql), {**params, "name": self.NAME}).rowcount:
+            raise RuntimeError("id_sequences has no applicant_id row — run migrations first")
+
+    def _reserve(self, n):
+        """Atomically claim [start, start + n) from the sequence row."""
+        with engine.begin() as conn:
+            self._update(
+                conn, "UPDATE id_sequences SET next_val = next_val + :n WHERE name = :name", {"n": n}
+            )
+            end = conn.execute(
+                text("SELECT next_val FROM id_sequences WHERE name = :name"),
+                {"name": self.NAME}
+            ).scalar()
+        return end - n, end
+
+    def take(self, count: int) -> list:
+        """Return `count` fresh IDs, reserving a new block only when the cache runs dry."""
+        out = []
+        with self._lock:
+            while len(out) < count:
+                if self._next >= self._end:
+                    need = max(self.block_size, count - len(out))
+                    self._next, self._end = self._reserve(need)
+                k = min(count - len(out), self._end - self._next)
+                out.extend(f"A{n}" for n in range(self._next, self._next + k))
+                self._next += k
+        return out
+
+    def observe(self, top: int):
+        """Make sure future IDs land above `top` (e.g. the highest ID in an uploaded file)."""
+        with self._lock:
+            # Drop any cached IDs at or below `top`
+            self._next = max(self._next, min(top + 1, self._end))
+            with engine.begin() as conn:
+                self._update(conn, """
+                    UPDATE id_sequences
+                    SET next_val = CASE WHEN next_val <= :top THEN :top + 1 ELSE next_val END
+                    WHERE name = :name
+                """, {"top": top})
+
+id_allocator = IdAllocator(ID_BLOCK_SIZE)
 
-def valid_aadhaar(v):
-    s = str(v).strip()
-    return s.isdigit() and len(s) == 12
+# =========================================================
+# LLM HTTP CLIENT (pooled session, retries, circuit breaker)
+# =========================================================
+class CircuitOpenError(Exception):
+    """Raised without touching the network while an endpoint's breaker is open."""
 
-def valid_pan(v):
-    return bool(re.match(r"^[A-Z]{5}[0-9]{4}[A-Z]$", str(v).strip().upper()))
+class CircuitBreaker:
+    """
+    Opens once the error rate over the last `window` calls crosses `error_rate`
+    (after at least `min_calls`). While open every call fast-fails; after
+    `cooldown` seconds a single trial call is let through (half-open).
+    """
 
-def valid_loan_amount(v):
+    def __init__(self, window, min_calls, error_rate, cooldown):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.cooldown:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self._trial:
+                self._trial = False
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+def _retry_after_seconds(value):
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds."""
+    if not value:
+        return None
     try:
-        return 500000 <= int(str(v).strip()) <= 10000000
-    except:
-        return False
-
-def valid_monthly_income(v):
+        return max(0.0, float(value))
+    except ValueError:
+        pass
     try:
-        return 25000 <= int(str(v).strip()) <= 1000000
-    except:
-        return False
-
-def valid_name(v):
-    parts = str(v).strip().split()
-    return (
-        len(parts) >= 1
-        and bool(re.match(r"^[A-Za-z ]+$", str(v).strip()))
-        and all(len(p) >= 2 for p in parts)
-    )
+        when = parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
-def is_null(v):
-    return str(v).strip() in ("nan", "None", "NaT", "none", "null", "")
+class RateLimiter:
+    """
+    Process-wide adaptive token bucket for one LLM endpoint.
+    Callers block in acquire() until a token is free, so concurrent pipelines
+    queue rather than fail. A 429 halves the rate (AIMD) and honours
+    Retry-After by pausing the bucket; each success nudges the rate back up.
+    """
 
-# =========================================================
-# ID GENERATOR
-# =========================================================
-_used_ids = set()
+    def __init__(self, rate, min_rate, max_rate, burst):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.throttled = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        with self._cond:
+            self.queued += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    else:
+                        self._cond.wait((1 - self._tokens) / self.rate)
+            finally:
+                self.queued -= 1
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+
+    def on_success(self):
+        with self._cond:
+            # Additive increase: +5% of the ceiling per success
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self, retry_after=None):
+        with self._cond:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "rate_per_sec": round(self.rate, 2),
+                "max_rate_per_sec": self.max_rate,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "throttled_total": self.throttled,
+                "paused_for_sec": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            }
+
+class LLMClient:
+    """
+    Keep-alive session for one LLM endpoint. Every request waits on the
+    endpoint's shared RateLimiter. 429s slow the limiter down and are retried
+    (up to LLM_THROTTLE_RETRIES); 5xx and connection errors are retried with
+    jittered exponential backoff. A read timeout is not retried: the
+    endpoint is hanging, and each retry would add another full timeout.
+    Repeated failures trip the breaker so callers fall back immediately
+    instead of waiting out timeouts.
+    """
 
-def next_id():
-    try:
-        with engine.connect() as conn:
-            rows = conn.execute(text("SELECT applicant_id FROM loan_applicants")).fetchall()
-            db_ids = {int(r[0][1:]) for r in rows if re.match(r"^A[0-9]+$", r[0])}
-    except Exception:
-        db_ids = set()
-    all_used = db_ids | _used_ids
-    start = max(all_used) + 1 if all_used else 101
-    n = start
-    while n in all_used:
-        n += 1
-    _used_ids.add(n)
-    return f"A{n}"
+    RETRY_STATUS = {500, 502, 503, 504}
+
+    def __init__(self, name, url, timeout, rate):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(
+            BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_ERROR_RATE, BREAKER_COOLDOWN
+        )
+        self.limiter = RateLimiter(rate, LLM_RATE_MIN, rate, LLM_RATE_BURST)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+    def _post(self, task):
+        self.limiter.acquire()
+        try:
+            return self.session.post(
+                self.url,
+                headers={"Authorization": f"Bearer {TOKEN}"},
+                data={"task": json.dumps(task)},
+                timeout=self.timeout
+            )
+        finally:
+            self.limiter.release()
+
+    def post_task(self, task) -> dict:
+        """POST {"task": json} and return the decoded JSON response."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} LLM circuit open — skipping call")
+
+        failures, throttles = 0, 0
+        while True:
+            try:
+                r = self._post(task)
+            except requests.ConnectionError as e:
+                # Includes ConnectTimeout — nothing was sent, so retrying is cheap
+                last_error, r = e, None
+            except Exception:
+                # Read timeouts (not retried: the endpoint is hanging) and any
+                # other failure; always recorded so a half-open trial is settled
+                self.breaker.record(False)
+                raise
+
+            if r is not None and r.status_code == 429:
+                retry_after = _retry_after_seconds(r.headers.get("Retry-After"))
+                self.limiter.on_throttle(retry_after)
+                last_error = requests.HTTPError(f"{self.name} LLM returned HTTP 429")
+                throttles += 1
+                if throttles > LLM_THROTTLE_RETRIES:
+                    break
+                if retry_after is None:
+                    time.sleep(self._backoff(min(throttles - 1, 6)))
+                continue
+
+            if r is not None and r.status_code not in self.RETRY_STATUS:
+                try:
+                    raw = r.json()
+                except ValueError:
+                    # Non-JSON body — not worth retrying
+                    self.breaker.record(False)
+                    raise
+                self.limiter.on_success()
+                self.breaker.record(True)
+                return raw
+
+            if r is not None:
+                last_error = requests.HTTPError(f"{self.name} LLM returned HTTP {r.status_code}")
+            failures += 1
+            if failures > LLM_MAX_RETRIES:
+                break
+            time.sleep(self._backoff(failures - 1))
+
+        self.breaker.record(False)
+        raise last_error
+
+mapping_client = LLMClient("mapping", MAPPING_API_URL, MAPPING_TIMEOUT, MAPPING_RATE_LIMIT)
+repair_client = LLMClient("repair", REPAIR_API_URL, REPAIR_TIMEOUT, REPAIR_RATE_LIMIT)
 
 # =========================================================
 # API 1 — FIELD MAPPING LLM
@@ -124,13 +663,7 @@ def call_llm_mapping(cols, fields, rows):
         "database_fields": fields,
         "data_rows": rows
     }
-    r = requests.post(
-        MAPPING_API_URL,
-        headers={"Authorization": f"Bearer {TOKEN}"},
-        data={"task": json.dumps(task)},
-        timeout=60
-    )
-    raw = r.json()
+    raw = mapping_client.post_task(task)
     print("MAPPING RAW:", raw)
 
     mp = {}
@@ -154,19 +687,304 @@ def call_llm_mapping(cols, fields, rows):
     return {k: v for k, v in mp.items() if k != "is_valid"}
 
 # =========================================================
-# API 2 — LLM UNJUMBLING (Langfuse/sneha1)
+# MAPPING CACHE (header signature → mapping, SQLite on disk)
 # =========================================================
-def call_llm_repair(row: dict) -> dict:
-    """Send one raw row to the Langfuse repair prompt and get cleaned fields back."""
-    r = requests.post(
-        REPAIR_API_URL,
-        headers={"Authorization": f"Bearer {TOKEN}"},
-        data={"task": json.dumps(row)},
-        timeout=60
+def _norm_col(c) -> str:
+    return str(c).strip().lower()
+
+def header_signature(cols) -> str:
+    """Sorted, lower-cased, whitespace-stripped column names, hashed."""
+    canonical = "\x1f".join(sorted(_norm_col(c) for c in cols))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+class MappingCache:
+    """
+    Persistent memo of call_llm_mapping results per header signature.
+    Mappings are stored against normalised column names so a layout that
+    only differs in case/whitespace still hits. Pinned entries are never
+    overwritten by a fresh LLM answer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS mapping_cache (
+                    signature  TEXT PRIMARY KEY,
+                    columns    TEXT NOT NULL,
+                    mapping    TEXT NOT NULL,
+                    pinned     INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, cols):
+        sig = header_signature(cols)
+        with self._lock:
+            try:
+                rec = self._db().execute(
+                    "SELECT mapping FROM mapping_cache WHERE signature = ?", (sig,)
+                ).fetchone()
+            except sqlite3.Error:
+                rec = None
+            if not rec:
+                self.misses += 1
+                return None
+            self.hits += 1
+        stored = json.loads(rec[0])
+        # Re-key onto the columns exactly as they appear in this file
+        return {c: stored[_norm_col(c)] for c in cols if _norm_col(c) in stored}
+
+    def put(self, cols, mapping: dict, pinned: bool = False):
+        if not mapping:
+            return None
+        sig = header_signature(cols)
+        stored = {_norm_col(k): v for k, v in mapping.items()}
+        with self._lock:
+            db = self._db()
+            rec = db.execute(
+                "SELECT pinned FROM mapping_cache WHERE signature = ?", (sig,)
+            ).fetchone()
+            if rec and rec[0] and not pinned:
+                return sig
+            db.execute(
+                "INSERT OR REPLACE INTO mapping_cache (signature, columns, mapping, pinned, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sig, json.dumps(sorted(_norm_col(c) for c in cols)),
+                 json.dumps(stored), int(pinned), time.time())
+            )
+            db.commit()
+        return sig
+
+    def invalidate(self, signature: str) -> bool:
+        with self._lock:
+            db = self._db()
+            cur = db.execute("DELETE FROM mapping_cache WHERE signature = ?", (signature,))
+            db.commit()
+            return cur.rowcount > 0
+
+    def entries(self) -> list:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT signature, columns, mapping, pinned, updated_at "
+                "FROM mapping_cache ORDER BY updated_at DESC"
+            ).fetchall()
+        return [
+            {"signature": r[0], "columns": json.loads(r[1]), "mapping": json.loads(r[2]),
+             "pinned": bool(r[3]), "updated_at": r[4]}
+            for r in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                n = self._db().execute("SELECT COUNT(*) FROM mapping_cache").fetchone()[0]
+            except sqlite3.Error:
+                n = None
+            return {"entries": n, "hits": self.hits, "misses": self.misses}
+
+mapping_cache = MappingCache(os.path.join(STATE_DIR, "mapping_cache.db"))
+
+# =========================================================
+# LOCAL MAPPING RESOLVER
+# Obvious headers ("Full Name", "Mobile No.", "PAN") are matched against
+# a synonym index; only columns it can't place go to the mapping LLM.
+# =========================================================
+FIELD_SYNONYMS = {
+    "applicant_id": [
+        "applicant id", "id", "app id", "application id", "application number",
+        "applicant number", "customer id", "reference id", "ref id",
+    ],
+    "applicant_name": [
+        "applicant name", "name", "full name", "customer name", "borrower name",
+        "applicant", "client name",
+    ],
+    "phone_number": [
+        "phone number", "phone", "mobile", "mobile number", "contact number",
+        "contact", "cell", "cell number", "telephone", "telephone number",
+    ],
+    "email": [
+        "email", "e mail", "email id", "email address", "mail", "mail id",
+    ],
+    "aadhaar_number": [
+        "aadhaar number", "aadhaar", "aadhar", "adhar", "aadhaar card", "uid", "uid number",
+    ],
+    "pan_number": [
+        "pan number", "pan", "pan card",
+    ],
+    "loan_amount": [
+        "loan amount", "loan", "amount", "amount requested", "requested amount",
+        "loan value", "principal",
+    ],
+    "loan_purpose": [
+        "loan purpose", "purpose", "purpose of loan", "loan reason", "reason",
+    ],
+    "employment_type": [
+        "employment type", "employment", "employment status", "job", "job type",
+        "occupation", "profession",
+    ],
+    "monthly_income": [
+        "monthly income", "income", "salary", "monthly salary", "income per month",
+        "net monthly income", "earnings",
+    ],
+}
+
+# Abbreviations expanded before lookup; units and filler words dropped
+_HEADER_ALIASES = {
+    "no": "number", "num": "number", "nbr": "number", "mob": "mobile", "ph": "phone",
+    "tel": "telephone", "amt": "amount", "emp": "employment", "cust": "customer",
+    "appl": "applicant", "addr": "address",
+}
+_HEADER_STOPWORDS = {"of", "the", "per", "rs", "inr", "in"}
+
+def header_tokens(col) -> tuple:
+    """'Mobile No. (Primary)' → ('mobile', 'number', 'primary')."""
+    s = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(col))
+    words = re.sub(r"[^a-z0-9]+", " ", s.lower()).split()
+    return tuple(
+        _HEADER_ALIASES.get(w, w) for w in words if w not in _HEADER_STOPWORDS
     )
-    raw = r.json()
-    print("REPAIR RAW:", raw)
 
+class HeaderIndex:
+    """
+    Precomputed lookup over FIELD_SYNONYMS (plus the DB field names):
+    an exact index on synonym token sets, an inverted token → synonym index
+    for partial matches, and the token vocabulary for typo correction.
+    """
+
+    def __init__(self, synonyms: dict):
+        self.exact = {}
+        self.by_token = {}
+        for field, phrases in synonyms.items():
+            for phrase in [field.replace("_", " "), *phrases]:
+                toks = frozenset(header_tokens(phrase))
+                self.exact.setdefault(toks, field)
+                for t in toks:
+                    self.by_token.setdefault(t, []).append((field, toks))
+        self.vocab = sorted(self.by_token)
+        self._fixed = {}
+
+    def _canonical(self, token: str) -> str:
+        """Snap a misspelt token ("adhaar", "emial") onto the vocabulary."""
+        if token in self.by_token or len(token) < 4:
+            return token
+        if token not in self._fixed:
+            close = difflib.get_close_matches(token, self.vocab, n=1, cutoff=0.8)
+            self._fixed[token] = close[0] if close else token
+        return self._fixed[token]
+
+    def scores(self, col) -> dict:
+        """{field: header similarity 0-1} for every field sharing a token with `col`."""
+        toks = frozenset(self._canonical(t) for t in header_tokens(col))
+        if not toks:
+            return {}
+        if toks in self.exact:
+            return {self.exact[toks]: 1.0}
+        best = {}
+        for t in toks:
+            for field, syn in self.by_token.get(t, ()):
+                dice = 2 * len(toks & syn) / (len(toks) + len(syn))
+                best[field] = max(best.get(field, 0.0), dice)
+        return best
+
+header_index = HeaderIndex(FIELD_SYNONYMS)
+
+def sample_agreement(values, field):
+    """Share of non-null sample values that pass `field`'s validator (None if all null)."""
+    s = as_clean_str(pd.Series(list(values), dtype=object))
+    s = s[~s.isin(NULL_TOKENS)]
+    if s.empty:
+        return None
+    return float(FIELD_CHECKS[field](s).fillna(False).astype(bool).mean())
+
+def resolve_locally(cols, rows, min_score=None):
+    """
+    Map the columns whose header clearly names a DB field. Sample values
+    that pass the field's validator add 0.2 to a header's score, values that
+    clearly fail take 0.2 off; columns tied between fields are left alone.
+    Returns ({column: field}, [unresolved columns]).
+    """
+    min_score = LOCAL_MAPPING_MIN_SCORE if min_score is None else min_score
+    candidates = []
+    for col in cols:
+        scored = {}
+        for field, score in header_index.scores(col).items():
+            agree = sample_agreement((r.get(col) for r in rows), field)
+            if agree is not None and agree >= 0.6:
+                score += 0.2
+            elif agree is not None and agree < 0.2 and len(rows) >= 3:
+                score -= 0.2
+            scored[field] = round(score, 6)
+        ranked = sorted(scored.items(), key=lambda kv: -kv[1])
+        if not ranked or ranked[0][1] < min_score:
+            continue
+        if len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            continue
+        candidates.extend((score, col, field) for field, score in ranked if score >= min_score)
+
+    mp, taken = {}, set()
+    for score, col, field in sorted(candidates, key=lambda c: -c[0]):
+        if col not in mp and field not in taken:
+            mp[col] = field
+            taken.add(field)
+    return mp, [c for c in cols if c not in mp]
+
+def resolve_mapping(cols, rows):
+    """
+    Mapping cache first, then the local resolver; only columns it can't
+    place (and only while DB fields remain unmapped) go to the mapping LLM.
+    Returns (mapping, info) where info reports how the columns were resolved.
+    """
+    info = {"source": "cache", "columns": len(cols), "resolved_locally": 0,
+            "sent_to_llm": 0, "local_ratio": 0.0}
+    mp = mapping_cache.get(cols)
+    if mp:
+        return mp, info
+
+    mp, unresolved = resolve_locally(cols, rows)
+    remaining = [f for f in DB_FIELDS if f not in mp.values()]
+    info.update(resolved_locally=len(mp), local_ratio=round(len(mp) / len(cols), 3) if cols else 0.0)
+    if not unresolved or not remaining:
+        info["source"] = "local"
+        return mp, info
+
+    info.update(source="llm" if not mp else "mixed", sent_to_llm=len(unresolved))
+    sample = [{c: r.get(c) for c in unresolved} for r in rows]
+    try:
+        answer = call_llm_mapping(unresolved, remaining, sample)
+    except Exception as e:
+        if not mp:
+            raise
+        # Keep the local part; nothing is cached so the LLM is asked again next time
+        print("MAPPING LLM FAILED, using local mapping:", e)
+        info.update(source="local", llm_error=str(e))
+        return mp, info
+    mp.update((c, f) for c, f in answer.items() if c in unresolved and f not in mp.values())
+    mapping_cache.put(cols, mp)
+    return mp, info
+
+def merge_mapping_info(infos) -> dict:
+    """Column counts and local ratio summed over several sheets' mapping info."""
+    infos = [i for i in infos if i]
+    out = {k: sum(i[k] for i in infos) for k in ("columns", "resolved_locally", "sent_to_llm")}
+    out["local_ratio"] = round(out["resolved_locally"] / out["columns"], 3) if out["columns"] else 0.0
+    return out
+
+# =========================================================
+# API 2 — LLM UNJUMBLING (Langfuse/sneha1)
+# =========================================================
+def _parse_repair_result(raw: dict):
+    """Pull the repair payload out of the gateway response (dict, list or fenced JSON string)."""
     result = raw.get("result", {}).get("result", "")
 
     # Strip markdown fences if present
@@ -175,64 +993,485 @@ def call_llm_repair(row: dict) -> dict:
         try:
             return json.loads(result)
         except:
-            return {}
+            return None
+
+    return result
+
+def call_llm_repair(row: dict) -> dict:
+    """Send one raw row to the Langfuse repair prompt and get cleaned fields back."""
+    raw = repair_client.post_task(row)
+    print("REPAIR RAW:", raw)
 
+    result = _parse_repair_result(raw)
     if isinstance(result, dict):
         return result
 
     return {}
 
+def call_llm_repair_batch(rows: list) -> list:
+    """
+    Send several raw rows in one task payload.
+    Each row is tagged with "_row" (its position in the batch) so the response
+    can be matched back. Returns a list aligned with `rows`; an entry is None
+    when the LLM dropped, duplicated or mangled that element.
+    """
+    task = [{"_row": i, **row} for i, row in enumerate(rows)]
+    raw = repair_client.post_task(task)
+    print("REPAIR BATCH RAW:", raw)
+
+    result = _parse_repair_result(raw)
+    if isinstance(result, dict):
+        result = result.get("rows", result.get("result"))
+    if not isinstance(result, list):
+        return [None] * len(rows)
+
+    out = [None] * len(rows)
+    duplicated = set()
+    for pos, item in enumerate(result):
+        if not isinstance(item, dict):
+            continue
+        # Prefer the echoed tag; fall back to position only if the count matches
+        tag = item.pop("_row", None)
+        if tag is None and len(result) == len(rows):
+            tag = pos
+        try:
+            tag = int(tag)
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= tag < len(rows):
+            continue
+        if out[tag] is not None:
+            duplicated.add(tag)
+        out[tag] = item or None
+
+    # Ambiguous answers are treated as malformed
+    for tag in duplicated:
+        out[tag] = None
+    return out
+
 # =========================================================
-# POST-REPAIR VALIDATION & FALLBACK
+# REPAIR CACHE (in-process LRU + SQLite on disk)
 # =========================================================
-def validate_and_fix(df: pd.DataFrame) -> pd.DataFrame:
-    """After LLM repair, run a final rule-based pass to catch any remaining issues."""
-    for i in df.index:
-        # applicant_id — assign new if invalid
-        aid = str(df.at[i, "applicant_id"]).strip()
-        if not valid_id(aid):
-            df.at[i, "applicant_id"] = next_id()
-        else:
+class RepairCache:
+    """
+    Content-addressed cache of repaired rows.
+    Key = sha256 of the canonical raw row JSON + REPAIR_PROMPT_VERSION.
+    Lookups go memory → disk; disk hits are promoted into memory.
+    """
+
+    def __init__(self, path, memory_size, disk_size, ttl, version):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.version = version
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS repair_cache (
+                    key        TEXT PRIMARY KEY,
+                    value      TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_repair_cache_created ON repair_cache (created_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def key(self, row: dict) -> str:
+        canonical = json.dumps(row, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(f"{self.version}\n{canonical}".encode()).hexdigest()
+
+    def get(self, row: dict):
+        k = self.key(row)
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(k)
+            if hit is not None:
+                value, created = hit
+                if now - created <= self.ttl:
+                    self._mem.move_to_end(k)
+                    self.hits_memory += 1
+                    return dict(value)
+                del self._mem[k]
+
             try:
-                _used_ids.add(int(aid[1:]))
-            except:
+                rec = self._db().execute(
+                    "SELECT value, created_at FROM repair_cache WHERE key = ?", (k,)
+                ).fetchone()
+            except sqlite3.Error:
+                rec = None
+            if rec and now - rec[1] <= self.ttl:
+                value = json.loads(rec[0])
+                self._remember(k, value, rec[1])
+                self.hits_disk += 1
+                return dict(value)
+
+            self.misses += 1
+            return None
+
+    def put(self, row: dict, value: dict):
+        if not value:
+            return
+        k = self.key(row)
+        now = time.time()
+        with self._lock:
+            self._remember(k, value, now)
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO repair_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (k, json.dumps(value, default=str), now)
+                )
+                db.commit()
+                self.writes += 1
+                if self.writes % 1000 == 0:
+                    self._evict_disk(db, now)
+            except sqlite3.Error:
                 pass
 
-        # phone
-        if not valid_phone(str(df.at[i, "phone_number"])):
-            df.at[i, "phone_number"] = None
+    def _remember(self, k, value, created):
+        self._mem[k] = (value, created)
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.memory_size:
+            self._mem.popitem(last=False)
+
+    def _evict_disk(self, db, now):
+        db.execute("DELETE FROM repair_cache WHERE created_at < ?", (now - self.ttl,))
+        db.execute("""
+            DELETE FROM repair_cache WHERE key IN (
+                SELECT key FROM repair_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.disk_size,))
+        db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                disk_entries = self._db().execute("SELECT COUNT(*) FROM repair_cache").fetchone()[0]
+            except sqlite3.Error:
+                disk_entries = None
+            hits = self.hits_memory + self.hits_disk
+            lookups = hits + self.misses
+            return {
+                "prompt_version": self.version,
+                "memory_entries": len(self._mem),
+                "disk_entries": disk_entries,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+            }
+
+repair_cache = RepairCache(
+    os.path.join(STATE_DIR, "repair_cache.db"),
+    REPAIR_CACHE_MEMORY_SIZE,
+    REPAIR_CACHE_DISK_SIZE,
+    REPAIR_CACHE_TTL,
+    REPAIR_PROMPT_VERSION,
+)
+
+# =========================================================
+# CONCURRENT REPAIR STAGE
+# =========================================================
+def _repair_one(idx, row: dict, fallback: dict, check_cache: bool = True):
+    """Repair a single row; returns (cleaned_row, error_or_None)."""
+    cached = repair_cache.get(row) if check_cache else None
+    if cached:
+        return cached, None
+    try:
+        cleaned = call_llm_repair(row)
+        if cleaned:
+            repair_cache.put(row, cleaned)
+            return cleaned, None
+        # Fallback: use mapped row as-is
+        return fallback, None
+    except Exception as e:
+        return fallback, {"row": idx, "error": str(e)}
+
+def _repair_batch(batch: list):
+    """
+    Repair a batch of (idx, row, fallback) jobs with one LLM call.
+    Cached rows are served locally; elements the batch call could not
+    answer are retried one by one.
+    """
+    cleaned = [repair_cache.get(row) for _, row, _ in batch]
+    pending = [i for i, c in enumerate(cleaned) if not c]
 
-        # email
-        if not valid_email(str(df.at[i, "email"])):
-            df.at[i, "email"] = None
+    if len(pending) > 1:
+        try:
+            fresh = call_llm_repair_batch([batch[i][1] for i in pending])
+        except Exception:
+            fresh = [None] * len(pending)
+        for i, c in zip(pending, fresh):
+            if c:
+                repair_cache.put(batch[i][1], c)
+                cleaned[i] = c
+
+    return [
+        (c, None) if c else _repair_one(*job, check_cache=False)
+        for job, c in zip(batch, cleaned)
+    ]
+
+def repair_rows(original_df: pd.DataFrame, mapped_df: pd.DataFrame,
+                max_workers: int = None, batch_size: int = None, on_batch=None):
+    """
+    Run the repair LLM over every row with at most `max_workers` calls in flight.
+    With `batch_size` > 1, rows are packed into multi-row requests.
+    Results come back in the original row order; failed or empty repairs fall
+    back to the mapped row and failures are recorded in `errors`.
+    `on_batch(results)` is called with each finished batch's (row, error)
+    pairs, for progress reporting.
+    """
+    max_workers = max(1, max_workers or REPAIR_MAX_WORKERS)
+    batch_size = max(1, batch_size or REPAIR_BATCH_SIZE)
+    jobs = [
+        (idx, row.to_dict(), mapped_df.loc[idx].to_dict())
+        for idx, row in original_df.iterrows()
+    ]
+    if not jobs:
+        return [], []
+
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    results = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        for chunk in pool.map(_repair_batch, batches):
+            results.extend(chunk)
+            if on_batch:
+                on_batch(chunk)
+
+    repaired_rows = [cleaned for cleaned, _ in results]
+    errors = [err for _, err in results if err]
+    return repaired_rows, errors
 
-        # aadhaar
-        if not valid_aadhaar(str(df.at[i, "aadhaar_number"])):
-            df.at[i, "aadhaar_number"] = None
+# =========================================================
+# RULE-FIRST TRIAGE
+# =========================================================
+def triage_clean_rows(mapped_df: pd.DataFrame, masks: pd.DataFrame = None) -> pd.Series:
+    """True for rows where every field already passes its validator after mapping."""
+    if masks is None:
+        masks = validity_masks(mapped_df)
+    return masks.all(axis=1)
 
-        # pan
-        pan = str(df.at[i, "pan_number"]).strip().upper()
-        df.at[i, "pan_number"] = pan if valid_pan(pan) else None
+# =========================================================
+# LOCAL UNJUMBLER (format-based, whole DataFrame at once)
+# =========================================================
+# Format classes that identify a field on their own (numbers are handled separately)
+_FORMAT_FIELDS = [
+    "applicant_id", "email", "phone_number", "aadhaar_number",
+    "pan_number", "loan_purpose", "employment_type", "applicant_name",
+]
+
+def _classify_cells(vals: pd.Series, src: pd.Series = None) -> tuple:
+    """
+    Classify every cell by format; `src` is the column each cell came from.
+    Returns (target field per cell or None, numeric value per cell, non-null mask).
+    """
+    s = as_clean_str(vals)
+    present = ~s.isin(NULL_TOKENS)
+
+    masks = {f: FIELD_CHECKS[f](s) for f in _FORMAT_FIELDS}
+    # "car", "salaried" … are valid names too; the controlled lists win
+    masks["applicant_name"] &= ~masks["loan_purpose"] & ~masks["employment_type"]
+    # Any off-list word ("Wedding", "Retired") also looks like a name, so a
+    # name is only trusted where it already sits; elsewhere it is ambiguous
+    if src is not None:
+        masks["applicant_name"] &= (src == "applicant_name").to_numpy()
+    hits = pd.DataFrame(masks).fillna(False).astype(bool)
+    hits = hits & present.to_numpy()[:, None]
+
+    num = int_values(s)
+    loan_ok = num.between(500000, 10000000)
+    income_ok = num.between(25000, 1000000)
+
+    n_hits = hits.sum(axis=1)
+    target = pd.Series(
+        np.where(n_hits == 1, hits.idxmax(axis=1), None), index=vals.index, dtype=object
+    )
+    numeric = (n_hits == 0) & (loan_ok | income_ok)
+    target[numeric & loan_ok & ~income_ok] = "loan_amount"
+    target[numeric & income_ok & ~loan_ok] = "monthly_income"
+    target[numeric & loan_ok & income_ok] = "_amount"
+    return target, num, present
+
+def local_unjumble(mapped_df: pd.DataFrame) -> tuple:
+    """
+    Reassign every value to the field its format identifies, across the whole
+    frame in one pass. Returns (resolved_df, resolved_mask); resolved_df holds
+    only rows where every non-null value had exactly one home.
+    """
+    if mapped_df.empty:
+        return mapped_df.copy(), pd.Series(False, index=mapped_df.index)
+
+    long = (
+        mapped_df[DB_FIELDS]
+        .rename_axis("_row")
+        .reset_index()
+        .melt(id_vars="_row", var_name="src", value_name="val")
+    )
+    target, num, present = _classify_cells(long["val"], long["src"])
+    long["target"] = target
+    long["num"] = num
+    long = long[present.to_numpy()]
+
+    # 500000–1000000 fits both loan and income. Already in one of those
+    # columns it stays put; from any other column it takes the amount slot
+    # the rest of the row leaves free, or stays ambiguous (→ LLM)
+    amt = long["target"] == "_amount"
+    stay = amt & long["src"].isin(["loan_amount", "monthly_income"])
+    long.loc[stay, "target"] = long.loc[stay, "src"]
+    amt = long["target"] == "_amount"
+    counts = pd.DataFrame({
+        "amt": amt,
+        "loan": long["target"] == "loan_amount",
+        "inc": long["target"] == "monthly_income",
+    }).groupby(long["_row"]).transform("sum")
+    n_amt, n_loan, n_inc = counts["amt"], counts["loan"], counts["inc"]
+    long.loc[amt, "target"] = np.select(
+        [
+            (n_amt == 1) & (n_loan == 0) & (n_inc >= 1),
+            (n_amt == 1) & (n_inc == 0) & (n_loan >= 1),
+        ],
+        ["loan_amount", "monthly_income"],
+        default=None,
+    )[amt.to_numpy()]
+
+    # A row resolves when every value has a home and no field is claimed twice
+    unresolved = long["target"].isna().groupby(long["_row"]).any()
+    clashes = long.dropna(subset=["target"]).duplicated(["_row", "target"], keep=False)
+    clashed = clashes.groupby(long.loc[clashes.index, "_row"]).any()
+    bad = unresolved.reindex(mapped_df.index, fill_value=False) | clashed.reindex(mapped_df.index, fill_value=False)
+    resolved_mask = ~bad
+
+    good = long[long["_row"].isin(mapped_df.index[resolved_mask])]
+    resolved = (
+        good.pivot(index="_row", columns="target", values="val")
+        .reindex(index=mapped_df.index[resolved_mask], columns=DB_FIELDS)
+    )
+    resolved = resolved.astype(object).where(resolved.notna(), None)
+    resolved.index.name = None
+    resolved.columns.name = None
+    return resolved, resolved_mask
 
-        # loan_amount
-        if not valid_loan_amount(str(df.at[i, "loan_amount"])):
-            df.at[i, "loan_amount"] = None
+# =========================================================
+# SAMPLE-LEARNED PERMUTATION
+# When a batch is jumbled the same way on every row, the LLM's answers
+# for a small sample give away the column shift; it is then replayed on
+# the remaining rows without further calls.
+# =========================================================
+def _cell_keys(col: pd.Series) -> pd.Series:
+    return as_clean_str(col).str.lower()
 
-        # monthly_income
-        if not valid_monthly_income(str(df.at[i, "monthly_income"])):
-            df.at[i, "monthly_income"] = None
+def apply_permutation(mapped_df: pd.DataFrame, perm: dict) -> tuple:
+    """
+    Move mapped columns per `perm` ({target field: source field}).
+    Returns (permuted_df, ok_mask); a row is ok when every value it has
+    landed in a field it validates for and none was left behind.
+    """
+    out = pd.DataFrame(
+        {f: mapped_df[perm[f]] if f in perm else None for f in DB_FIELDS}, index=mapped_df.index
+    )
+    present = pd.DataFrame({f: ~as_clean_str(out[f]).isin(NULL_TOKENS) for f in DB_FIELDS})
+    ok = (validity_masks(out) | ~present).all(axis=1)
+    for src in DB_FIELDS:
+        if src not in perm.values():
+            ok &= as_clean_str(mapped_df[src]).isin(NULL_TOKENS)
+    return out.astype(object).where(out.notna(), None), ok
+
+def learn_permutation(mapped: pd.DataFrame, repaired: pd.DataFrame,
+                      min_agreement: float = None, min_votes: int = 3):
+    """
+    Infer the source column of every field from LLM-repaired sample rows:
+    the mapped column holding the same value (case/whitespace-insensitive)
+    in at least `min_agreement` of the rows where exactly one column does.
+    Fields without enough evidence stay put. Returns {target: source}, or
+    None when the sample shows no consistent shift or the shift does not
+    leave the sample with more valid cells than it had.
+    """
+    min_agreement = PERMUTATION_MIN_AGREEMENT if min_agreement is None else min_agreement
+    src = pd.DataFrame({f: _cell_keys(mapped[f]) for f in DB_FIELDS}, index=mapped.index)
+
+    perm = {}
+    for target in DB_FIELDS:
+        want = _cell_keys(repaired[target])
+        hits = src.eq(want, axis=0) & ~want.isin(NULL_TOKENS).to_numpy()[:, None]
+        unique = hits.sum(axis=1) == 1
+        if unique.sum() < min_votes:
+            continue
+        votes = hits[unique].idxmax(axis=1).value_counts()
+        if votes.iloc[0] >= min_agreement * unique.sum():
+            perm[target] = votes.index[0]
+
+    if len(set(perm.values())) < len(perm):
+        return None
+    for f in DB_FIELDS:
+        if f not in perm and f not in perm.values():
+            perm[f] = f
+    if all(target == source for target, source in perm.items()):
+        return None
+
+    permuted, _ = apply_permutation(mapped, perm)
+    if validity_masks(permuted).to_numpy().sum() <= validity_masks(mapped).to_numpy().sum():
+        return None
+    return perm
+
+def permutation_sample(idx: pd.Index, size: int = None) -> pd.Index:
+    """Random (but repeatable) sample of row labels, in their original order."""
+    size = min(PERMUTATION_SAMPLE if size is None else size, len(idx))
+    picks = np.random.default_rng(0).choice(len(idx), size=size, replace=False)
+    return idx[np.sort(picks)]
 
-        # loan_purpose
-        lp = str(df.at[i, "loan_purpose"]).strip().lower()
-        df.at[i, "loan_purpose"] = lp.title() if lp in LOAN_PURPOSES else None
+# =========================================================
+# POST-REPAIR VALIDATION & FALLBACK
+# =========================================================
+def validate_and_fix(df: pd.DataFrame, masks: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    After LLM repair, run a final rule-based pass to catch any remaining issues.
+    Works column-wise off validity_masks(): invalid values become None, PAN is
+    upper-cased, controlled-list values are title-cased, and rows without a
+    valid applicant_id get a fresh one. A `masks` frame passed in is updated
+    in place so it describes the fixed frame and can go straight to
+    compute_quality().
+    """
+    if masks is None:
+        masks = validity_masks(df)
+
+    # applicant_id — keep valid ones (new IDs go above them), assign new if invalid
+    ids = as_clean_str(df["applicant_id"])
+    valid_ids = masks["applicant_id"]
+    if valid_ids.any():
+        id_allocator.observe(max(int(a[1:]) for a in ids[valid_ids]))
+    df["applicant_id"] = df["applicant_id"].astype(object)
+    df.loc[~valid_ids, "applicant_id"] = id_allocator.take(int((~valid_ids).sum()))
+    masks["applicant_id"] = True
+
+    # pan — normalised to upper case
+    df["pan_number"] = as_clean_str(df["pan_number"]).str.upper().astype(object).where(
+        masks["pan_number"], None
+    )
 
-        # employment_type
-        et = str(df.at[i, "employment_type"]).strip().lower()
-        df.at[i, "employment_type"] = et.title() if et in EMPLOYMENT_TYPES else None
+    # loan_purpose / employment_type — canonical title case
+    for field in ("loan_purpose", "employment_type"):
+        df[field] = as_clean_str(df[field]).str.lower().str.title().astype(object).where(
+            masks[field], None
+        )
 
-        # name
-        if not valid_name(str(df.at[i, "applicant_name"])):
-            df.at[i, "applicant_name"] = None
+    # everything else — keep as-is if valid, else None
+    for field in ("applicant_name", "phone_number", "email", "aadhaar_number",
+                  "loan_amount", "monthly_income"):
+        df[field] = df[field].astype(object).where(masks[field], None)
 
     return df
 
@@ -248,159 +1487,797 @@ def ensure_columns(df):
 # =========================================================
 # QUALITY METRICS
 # =========================================================
-def compute_quality(df: pd.DataFrame) -> dict:
-    total = len(df)
-    if total == 0:
-        return {}
-
-    validators = {
-        "applicant_id":   valid_id,
-        "applicant_name": valid_name,
-        "phone_number":   valid_phone,
-        "email":          valid_email,
-        "aadhaar_number": valid_aadhaar,
-        "pan_number":     valid_pan,
-        "loan_amount":    valid_loan_amount,
-        "loan_purpose":   lambda v: str(v).strip().lower() in LOAN_PURPOSES,
-        "employment_type":lambda v: str(v).strip().lower() in EMPLOYMENT_TYPES,
-        "monthly_income": valid_monthly_income,
+class QualityAccumulator:
+    """
+    Running per-field valid counts, fed one validity-mask chunk at a time,
+    so long jobs can report a live score and the final score costs nothing extra.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.valid = pd.Series(0, index=DB_FIELDS, dtype="int64")
+        self._lock = threading.Lock()   # sheets of one file share an accumulator
+
+    def add(self, masks: pd.DataFrame):
+        counts = masks[DB_FIELDS].sum()
+        with self._lock:
+            self.rows += len(masks)
+            self.valid = self.valid.add(counts, fill_value=0).astype("int64")
+
+    def score(self) -> dict:
+        with self._lock:
+            rows, valid = self.rows, self.valid
+        if rows == 0:
+            return {}
+        field_scores = {
+            field: round(int(valid[field]) / rows * 100, 1) for field in DB_FIELDS
+        }
+        overall = round(sum(field_scores.values()) / len(field_scores), 1)
+        return {"overall": overall, "fields": field_scores}
+
+def compute_quality(df: pd.DataFrame, masks: pd.DataFrame = None) -> dict:
+    """Per-field % of present, valid values; reuses `masks` when given."""
+    acc = QualityAccumulator()
+    acc.add(validity_masks(df) if masks is None else masks)
+    return acc.score()
+
+# =========================================================
+# UPSERT SQL
+# =========================================================
+_UPSERT_COLUMNS = DB_FIELDS
+_UPSERT_UPDATES = [c for c in DB_FIELDS if c != "applicant_id"]
+
+def _upsert_sql(dialect: str) -> str:
+    cols = ", ".join(_UPSERT_COLUMNS)
+    params = ", ".join(f":{c}" for c in _UPSERT_COLUMNS)
+    # created_at comes from the column default; keeping VALUES placeholder-only
+    # lets pymysql rewrite executemany into one multi-row INSERT
+    insert = f"""
+    INSERT INTO loan_applicants ({cols})
+    VALUES ({params})
+    """
+    if dialect == "sqlite":
+        # SQLite stand-in (tests, benchmarks)
+        sets = ", ".join(f"{c}=excluded.{c}" for c in _UPSERT_UPDATES)
+        return insert + f"ON CONFLICT(applicant_id) DO UPDATE SET {sets}"
+    sets = ", ".join(f"{c}=VALUES({c})" for c in _UPSERT_UPDATES)
+    return insert + f"ON DUPLICATE KEY UPDATE {sets}"
+
+# =========================================================
+# STATS SUMMARY (applicant_stats, maintained by upsert)
+# =========================================================
+_STATS_FIELDS = ["loan_purpose", "employment_type", "loan_amount", "monthly_income"]
+
+def _stats_delta_sql(dialect: str) -> str:
+    insert = """
+    INSERT INTO applicant_stats (dimension, bucket, cnt, total)
+    VALUES (:dimension, :bucket, :cnt, :total)
+    """
+    if dialect == "sqlite":
+        return insert + "ON CONFLICT(dimension, bucket) DO UPDATE SET cnt = cnt + excluded.cnt, total = total + excluded.total"
+    return insert + "ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), total = total + VALUES(total)"
+
+def _to_decimal(v):
+    try:
+        return Decimal(str(v))
+    except (InvalidOperation, ValueError):
+        return None
+
+def _add_stats(delta: dict, row: dict, sign: int):
+    """Add (sign=1) or remove (sign=-1) one applicant's contribution to `delta`."""
+    def bump(key, total=Decimal(0)):
+        cnt, tot = delta.get(key, (0, Decimal(0)))
+        delta[key] = (cnt + sign, tot + sign * total)
+
+    bump(("all", ""))
+    bump(("purpose", row.get("loan_purpose") or ""))
+    bump(("employment", row.get("employment_type") or ""))
+    for field in ("loan_amount", "monthly_income"):
+        amount = _to_decimal(row.get(field)) if row.get(field) is not None else None
+        if amount is not None:
+            bump((field, ""), amount)
+
+def rebuild_stats():
+    """Recompute applicant_stats from scratch (e.g. after manual edits to loan_applicants)."""
+    with engine.begin() as conn:
+        for stmt in STATS_REBUILD_SQL:
+            conn.execute(text(stmt))
+    stats_cache.invalidate()
+
+def read_stats() -> dict:
+    """/stats/ payload from a single read of the summary table."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT dimension, bucket, cnt, total FROM applicant_stats")).fetchall()
+    by_dim = {}
+    for dim, bucket, cnt, total in rows:
+        if cnt > 0:
+            by_dim.setdefault(dim, []).append((bucket or None, int(cnt), total))
+
+    def avg(dim):
+        entry = by_dim.get(dim)
+        return round(float(entry[0][2]) / entry[0][1], 2) if entry else 0
+
+    return {
+        "total_applicants": by_dim.get("all", [(None, 0, 0)])[0][1],
+        "by_purpose": [{"purpose": b, "count": c} for b, c, _ in by_dim.get("purpose", [])],
+        "by_employment": [{"type": b, "count": c} for b, c, _ in by_dim.get("employment", [])],
+        "avg_loan_amount": avg("loan_amount"),
+        "avg_monthly_income": avg("monthly_income"),
     }
 
-    field_scores = {}
-    for field, validator in validators.items():
-        if field not in df.columns:
-            field_scores[field] = 0
-            continue
-        valid_count = df[field].apply(
-            lambda v: False if is_null(str(v)) else validator(str(v))
-        ).sum()
-        field_scores[field] = round((valid_count / total) * 100, 1)
+class StatsCache:
+    """
+    Serves one /stats/ payload to every caller for up to `ttl` seconds, with a
+    single loader at a time. invalidate() is called after each commit that
+    changes applicant_stats; a load that was already running when that
+    happened is returned to its caller but not kept.
+    """
 
-    overall = round(sum(field_scores.values()) / len(field_scores), 1)
-    return {"overall": overall, "fields": field_scores}
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, loader) -> tuple:
+        """Return (payload, age in seconds)."""
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value, time.monotonic() - self._loaded_at
+            self.misses += 1
+            generation = self._generation
+            value = loader()
+            if generation == self._generation:
+                self._value, self._loaded_at = value, time.monotonic()
+            return value, 0.0
+
+    def invalidate(self):
+        self._generation += 1
+        self._value = None
+
+    def stats(self) -> dict:
+        return {"ttl_sec": self.ttl, "hits": self.hits, "misses": self.misses}
+
+stats_cache = StatsCache(STATS_CACHE_TTL)
 
 # =========================================================
 # UPSERT
 # =========================================================
-def upsert(df):
+def upsert(df, chunk_size: int = None):
+    """
+    Bulk insert-or-update in chunks of `chunk_size` rows. Each chunk costs one
+    IN (...) lookup (so inserted/updated counts and stats deltas stay exact)
+    plus one executemany of INSERT ... ON DUPLICATE KEY UPDATE, which the
+    MySQL driver sends as a single multi-row statement. applicant_stats is
+    adjusted in the same transaction.
+    """
+    chunk_size = max(1, chunk_size or UPSERT_CHUNK_SIZE)
+    df = ensure_columns(df.copy())
+    for col in DB_FIELDS:
+        df[col] = df[col].astype(object).where(~as_clean_str(df[col]).isin(NULL_TOKENS), None)
+    records = df.to_dict("records")
+
     ins, upd = 0, 0
-    with engine.begin() as conn:
-        for _, r in df.iterrows():
-            d = {k: (None if is_null(str(v)) else v) for k, v in r.to_dict().items()}
-            exists = conn.execute(
-                text("SELECT COUNT(*) FROM loan_applicants WHERE applicant_id=:id"),
-                {"id": d["applicant_id"]}
-            ).scalar()
+    current = {}   # applicant_id → stats fields as they stand in this transaction
+    delta = {}     # (dimension, bucket) → (cnt, total)
+    dialect = engine.dialect.name
+    sql = text(_upsert_sql(dialect))
+    lookup = text(
+        f"SELECT applicant_id, {', '.join(_STATS_FIELDS)} FROM loan_applicants "
+        "WHERE applicant_id IN :ids" + (" FOR UPDATE" if dialect == "mysql" else "")
+    ).bindparams(bindparam("ids", expanding=True))
 
-            if exists:
-                conn.execute(text("""
-                UPDATE loan_applicants SET
-                  applicant_name=:applicant_name, phone_number=:phone_number,
-                  email=:email, aadhaar_number=:aadhaar_number,
-                  pan_number=:pan_number, loan_amount=:loan_amount,
-                  loan_purpose=:loan_purpose, employment_type=:employment_type,
-                  monthly_income=:monthly_income
-                WHERE applicant_id=:applicant_id
-                """), d)
-                upd += 1
-            else:
-                conn.execute(text("""
-                INSERT INTO loan_applicants (
-                  applicant_id, applicant_name, phone_number, email,
-                  aadhaar_number, pan_number, loan_amount,
-                  loan_purpose, employment_type, monthly_income, created_at
-                ) VALUES (
-                  :applicant_id, :applicant_name, :phone_number, :email,
-                  :aadhaar_number, :pan_number, :loan_amount,
-                  :loan_purpose, :employment_type, :monthly_income, NOW()
-                )
-                """), d)
-                ins += 1
+    with engine.begin() as conn:
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            ids = [aid for aid in {r["applicant_id"] for r in chunk} if aid not in current]
+            if ids:
+                for row in conn.execute(lookup, {"ids": ids}):
+                    current[row[0]] = dict(zip(_STATS_FIELDS, row[1:]))
+
+            # A repeated ID within the upload counts as an update, as before
+            for r in chunk:
+                aid = r["applicant_id"]
+                if aid in current:
+                    upd += 1
+                    _add_stats(delta, current[aid], -1)
+                else:
+                    ins += 1
+                _add_stats(delta, r, 1)
+                current[aid] = {f: r[f] for f in _STATS_FIELDS}
+            conn.execute(sql, chunk)
+
+        changes = [
+            {"dimension": dim, "bucket": bucket, "cnt": cnt, "total": str(total)}
+            for (dim, bucket), (cnt, total) in delta.items()
+            if cnt or total
+        ]
+        if changes:
+            conn.execute(text(_stats_delta_sql(dialect)), changes)
+    stats_cache.invalidate()
     return ins, upd
 
 # =========================================================
 # CORE PIPELINE
 # =========================================================
-def run_pipeline(original_df: pd.DataFrame):
+def run_pipeline(original_df: pd.DataFrame, progress=None, mapping=None, live=None, final=None):
     """
     Full pipeline:
-      1. Call API 1 → field mapping (rename columns)
-      2. Call API 2 (per row) → LLM unjumbling
-      3. Rule-based final validation pass
-    Returns: (cleaned_df, mapping, quality_metrics)
+      1. Call API 1 → field mapping (rename columns; cached per header signature)
+      2. Triage — rows that already pass every validator skip the LLM
+      3. Local unjumbler — reassign dirty rows by value format
+      4. Call API 2 (per still-ambiguous row, concurrently) → LLM unjumbling;
+         with many such rows a sample goes first and the column shift it
+         reveals is applied to the rest, which then skip the LLM if they validate
+      5. Rule-based final validation pass
+    Returns: (cleaned_df, mapping, quality_metrics, errors, summary);
+    summary["mapping_stats"] says how the mapping was resolved (None when
+    a known `mapping` was passed in).
+    `progress(stage, rows_done, rows_total, quality)` is called as the run
+    advances; `quality` is a live score over the rows finished so far.
+    A known `mapping` skips step 1, a shared `live` accumulator carries
+    the live score across chunks and a shared `final` one collects the
+    step 5 masks, so callers score several chunks without re-validating
+    them (see run_pipeline_chunked).
     """
-    _used_ids.clear()
+    total = len(original_df)
+    report = progress or (lambda stage, done, total, quality=None: None)
+    live = live or QualityAccumulator()
 
     # --- STEP 1: Field Mapping ---
-    mp = call_llm_mapping(
-        original_df.columns.tolist(),
-        DB_FIELDS,
-        original_df.head(5).to_dict("records")  # send sample rows for context
-    )
+    report("mapping", 0, total)
+    mapping_stats = None
+    if mapping is not None:
+        mp = mapping
+    else:
+        mp, mapping_stats = resolve_mapping(
+            original_df.columns.tolist(),
+            original_df.head(5).to_dict("records")  # send sample rows for context
+        )
 
     # Rename columns per mapping
     mapped_df = original_df.copy()
     mapped_df.rename(columns=mp, inplace=True)
     mapped_df = ensure_columns(mapped_df)
 
-    # --- STEP 2: LLM Unjumbling (row by row) ---
-    repaired_rows = []
-    errors = []
-
-    for idx, row in original_df.iterrows():
-        try:
-            cleaned = call_llm_repair(row.to_dict())
-            if cleaned:
-                repaired_rows.append(cleaned)
-            else:
-                # Fallback: use mapped row as-is
-                repaired_rows.append(mapped_df.loc[idx].to_dict())
-        except Exception as e:
-            errors.append({"row": idx, "error": str(e)})
-            repaired_rows.append(mapped_df.loc[idx].to_dict())
+    # --- STEP 2: Triage — rows that already validate skip the LLM ---
+    mapped_masks = validity_masks(mapped_df)
+    clean = triage_clean_rows(mapped_df, mapped_masks)
+    dirty_idx = clean.index[~clean]
+
+    # --- STEP 3: Local format-based unjumbling of dirty rows ---
+    local_df, local_ok = local_unjumble(mapped_df.loc[dirty_idx])
+    llm_idx = local_ok.index[~local_ok]
+
+    # Live quality: rows missing an ID get one in step 5, so count IDs as valid
+    live.add(mapped_masks[clean].assign(applicant_id=True))
+    live.add(validity_masks(local_df).assign(applicant_id=True))
+
+    # --- STEP 4: LLM Unjumbling (rows the local pass left ambiguous, concurrent) ---
+    done = [total - len(llm_idx)]
+    report("repair", done[0], total, live.score())
+
+    # Repaired rows are scored in bulk, at most every PROGRESS_INTERVAL
+    # seconds, and only when someone is listening
+    pending, last_flush = [], [time.monotonic()]
+
+    def flush():
+        if pending:
+            batch_df = ensure_columns(pd.DataFrame(pending))
+            live.add(validity_masks(batch_df).assign(applicant_id=True))
+            pending.clear()
+        last_flush[0] = time.monotonic()
+        report("repair", done[0], total, live.score())
+
+    def on_batch(chunk):
+        done[0] += len(chunk)
+        pending.extend(row for row, _ in chunk)
+        if time.monotonic() - last_flush[0] >= PROGRESS_INTERVAL:
+            flush()
+
+    if progress is None:
+        on_batch = None
+
+    repaired_by_idx, errors = {}, []
+    permuted_df = mapped_df.iloc[:0]
+    if PERMUTATION_SAMPLE > 0 and len(llm_idx) >= PERMUTATION_MIN_ROWS:
+        sample_idx = permutation_sample(llm_idx)
+        repaired, errors = repair_rows(original_df.loc[sample_idx], mapped_df, on_batch=on_batch)
+        repaired_by_idx.update(zip(sample_idx, repaired))
+        llm_idx = llm_idx.difference(sample_idx, sort=False)
+        perm = learn_permutation(
+            mapped_df.loc[sample_idx],
+            ensure_columns(pd.DataFrame(repaired, index=sample_idx))
+        )
+        if perm:
+            permuted_df, permuted_ok = apply_permutation(mapped_df.loc[llm_idx], perm)
+            permuted_df = permuted_df[permuted_ok]
+            llm_idx = llm_idx[~permuted_ok.to_numpy()]
+            live.add(validity_masks(permuted_df).assign(applicant_id=True))
+            done[0] += len(permuted_df)
+            if on_batch:
+                flush()
+        sent_to_llm = len(sample_idx) + len(llm_idx)
+    else:
+        sent_to_llm = len(llm_idx)
+
+    repaired, more_errors = repair_rows(original_df.loc[llm_idx], mapped_df, on_batch=on_batch)
+    errors.extend(more_errors)
+    if on_batch:
+        flush()
+    repaired_by_idx.update(zip(llm_idx, repaired))
+    for fixed in (local_df, permuted_df):
+        repaired_by_idx.update(zip(fixed.index, fixed.to_dict("records")))
+    repaired_rows = [
+        repaired_by_idx[idx] if idx in repaired_by_idx else mapped_df.loc[idx].to_dict()
+        for idx in original_df.index
+    ]
 
     df = pd.DataFrame(repaired_rows)
     df = ensure_columns(df)
 
-    # --- STEP 3: Final rule-based validation ---
-    df = validate_and_fix(df)
+    # --- STEP 5: Final rule-based validation ---
+    report("validating", total, total)
+    masks = validity_masks(df)
+    df = validate_and_fix(df, masks)
     df.reset_index(drop=True, inplace=True)
 
-    quality = compute_quality(df)
+    quality = compute_quality(df, masks)
+    if final is not None:
+        final.add(masks)
+    summary = {
+        "triage": {
+            "clean": int(clean.sum()),
+            "resolved_locally": int(local_ok.sum()),
+            "permuted": int(len(permuted_df)),
+            "sent_to_llm": int(sent_to_llm),
+        },
+        "mapping_stats": mapping_stats,
+    }
+
+    return df, mp, quality, errors, summary
+
+# =========================================================
+# INPUT FORMATS (xlsx — every sheet —, csv, parquet)
+# Every reader returns the all-str frames read_excel(dtype=str) gives,
+# so the pipeline never sees a difference between formats.
+# =========================================================
+INPUT_FORMATS = ("xlsx", "csv", "parquet")
+
+def detect_format(filename: str, head: bytes) -> str:
+    """Sniff magic bytes first, then the extension; anything else is read as CSV."""
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if ext in ("parquet", "pq"):
+        return "parquet"
+    if ext in ("xlsx", "xlsm"):
+        return "xlsx"
+    return "csv"
+
+def detect_file_format(source, filename: str = None) -> str:
+    """detect_format for a path or a seekable file object (left at position 0)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(8)
+        return detect_format(filename or str(source), head)
+    head = source.read(8)
+    source.seek(0)
+    return detect_format(filename, head)
+
+def _cell_str(v):
+    """Cell value as pd.read_excel(dtype=str) would give it."""
+    if v is None or v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v)
+
+def _header_names(cells) -> list:
+    names, seen = [], {}
+    for i, c in enumerate(cells):
+        name = str(c) if c is not None else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _str_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Typed (Parquet/Arrow) frame → object frame of str/None; integral floats lose their '.0'."""
+    out = {}
+    for c in df.columns:
+        col = df[c]
+        if pd.api.types.is_float_dtype(col) and (col.dropna() % 1 == 0).all():
+            col = col.astype("Int64")
+        col = col.astype("string")
+        out[str(c)] = col.astype(object).where(col.notna(), None)
+    return pd.DataFrame(out, index=df.index)
+
+def _csv_options(source):
+    """pyarrow CSV options with every column read as string (header sniffed first)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), [])
+    else:
+        text_view = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+        header = next(csv.reader(text_view), [])
+        text_view.detach()   # don't let the wrapper close the upload
+        source.seek(0)
+    return pa_csv.ConvertOptions(column_types={n: pa.string() for n in header}, strings_can_be_null=True)
+
+def read_sheets(source, fmt: str) -> dict:
+    """{sheet name: str DataFrame} for a whole file; single-table formats give one entry."""
+    if fmt == "xlsx":
+        sheets = pd.read_excel(source, sheet_name=None, dtype=str)
+        sheets = {name: df for name, df in sheets.items() if len(df.columns)} or {"Sheet1": pd.DataFrame()}
+    elif fmt == "parquet":
+        sheets = {"data": _str_frame(pd.read_parquet(source))}
+    else:
+        options = _csv_options(source)
+        if not options.column_types:
+            return {"data": pd.DataFrame()}
+        table = pa_csv.read_csv(source if isinstance(source, (str, os.PathLike)) else pa.PythonFile(source, mode="r"),
+                                convert_options=options)
+        sheets = {"data": _str_frame(table.to_pandas())}
+    for df in sheets.values():
+        df.reset_index(drop=True, inplace=True)
+    return sheets
+
+def _rechunk(frames, chunk_size: int):
+    """Regroup an iterable of DataFrames into chunk_size-row frames indexed by row position."""
+    buf, start = [], 0
+    for df in frames:
+        buf.append(df)
+        pending = sum(len(b) for b in buf)
+        while pending >= chunk_size:
+            merged = pd.concat(buf, ignore_index=True)
+            yield merged.iloc[:chunk_size].set_axis(pd.RangeIndex(start, start + chunk_size))
+            buf, start = [merged.iloc[chunk_size:]], start + chunk_size
+            pending -= chunk_size
+    merged = pd.concat(buf, ignore_index=True) if buf else pd.DataFrame()
+    if len(merged) or start == 0:
+        yield merged.set_axis(pd.RangeIndex(start, start + len(merged)))
+
+def _iter_xlsx_sheet(ws, chunk_size: int):
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, ())
+    if not any(c is not None for c in header):
+        return   # empty sheet, skipped like read_sheets does
+    columns = _header_names(header)
+    width, buf, blank, start = len(columns), [], [], 0
+    for cells in rows:
+        values = [_cell_str(v) for v in cells[:width]]
+        values += [None] * (width - len(values))
+        # Like read_excel: keep blank rows between data, drop trailing ones
+        if not any(v is not None for v in values):
+            blank.append(values)
+            continue
+        buf += blank + [values]
+        blank = []
+        while len(buf) >= chunk_size:
+            yield pd.DataFrame(buf[:chunk_size], columns=columns,
+                               index=pd.RangeIndex(start, start + chunk_size), dtype=object)
+            start, buf = start + chunk_size, buf[chunk_size:]
+    if buf or start == 0:
+        yield pd.DataFrame(buf, columns=columns, index=pd.RangeIndex(start, start + len(buf)), dtype=object)
+
+def iter_chunks(path: str, fmt: str, chunk_size: int = None):
+    """
+    (chunks, approx_rows) for a file on disk, read incrementally: openpyxl
+    read-only for xlsx (every non-empty sheet in turn), pyarrow's streaming
+    reader for CSV and row batches for Parquet. Chunks are (sheet, str
+    DataFrame) pairs indexed by row position within the sheet.
+    """
+    chunk_size = max(1, chunk_size or STREAM_CHUNK_ROWS)
+
+    if fmt == "xlsx":
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        approx_rows = sum(max(0, (ws.max_row or 1) - 1) for ws in wb.worksheets)
+
+        def chunks():
+            try:
+                empty = True
+                for ws in wb.worksheets:
+                    for df in _iter_xlsx_sheet(ws, chunk_size):
+                        empty = False
+                        yield ws.title, df
+                if empty:
+                    yield "Sheet1", pd.DataFrame()
+            finally:
+                wb.close()
+        return chunks(), approx_rows
+
+    if fmt == "parquet":
+        pf = pq.ParquetFile(path)
+
+        def chunks():
+            frames = (_str_frame(b.to_pandas()) for b in pf.iter_batches(batch_size=chunk_size))
+            for df in _rechunk(frames, chunk_size):
+                yield "data", df
+        return chunks(), pf.metadata.num_rows
+
+    def chunks():
+        reader = pa_csv.open_csv(path, convert_options=_csv_options(path))
+        frames = (_str_frame(b.to_pandas()) for b in reader)
+        for df in _rechunk(frames, chunk_size):
+            yield "data", df
+    # Row count unknown up front; estimate from the size of the first MB
+    with open(path, "rb") as f:
+        sample = f.read(1 << 20)
+    approx_rows = int(os.path.getsize(path) / max(1, len(sample)) * max(0, sample.count(b"\n") - 1))
+    return chunks(), approx_rows
+
+# =========================================================
+# CHUNKED / MULTI-SHEET PIPELINE
+# Large files are pushed through mapping → repair → validate → sink a
+# chunk at a time, so only one chunk's frames are alive at once whatever
+# the file size. Smaller multi-sheet files run one sheet per thread.
+# Each sheet gets its own mapping (and so its own header signature).
+# =========================================================
+def rss_mb() -> float:
+    """Resident memory of this process right now (lifetime peak where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _add_triage(into: dict, triage: dict):
+    for key, n in triage.items():
+        into[key] = into.get(key, 0) + n
+
+def run_pipeline_chunked(chunks, total: int, sink, progress=None):
+    """
+    run_pipeline over an iterable of (sheet, DataFrame) chunks. Each cleaned
+    chunk goes to `sink(df)` (upsert, staging, ...) before the next one is
+    read; the mapping is resolved once per sheet from its first chunk.
+    Returns (mapping, quality, errors, summary); mapping is the first
+    sheet's, summary carries per-sheet mappings plus total_rows and chunks.
+    """
+    report = progress or (lambda stage, done, total, quality=None: None)
+    live, final = QualityAccumulator(), QualityAccumulator()
+    sheets, errors, rows_done, n_chunks = {}, [], 0, 0
+    triage = {"clean": 0, "resolved_locally": 0, "permuted": 0, "sent_to_llm": 0}
+
+    for sheet, chunk in chunks:
+        offset = rows_done
+        info = sheets.setdefault(
+            sheet, {"mapping": None, "mapping_stats": None, "total_rows": 0, "triage": {}}
+        )
+
+        def chunk_progress(stage, done, chunk_total, quality=None):
+            report(stage, offset + done, max(total, offset + chunk_total), quality)
+
+        df, info["mapping"], _, chunk_errors, summary = run_pipeline(
+            chunk, chunk_progress, mapping=info["mapping"], live=live, final=final
+        )
+        chunk_progress("saving", len(chunk), len(chunk))
+        sink(df)
+
+        errors.extend({"sheet": sheet, **e} for e in chunk_errors)
+        info["mapping_stats"] = info["mapping_stats"] or summary["mapping_stats"]
+        _add_triage(triage, summary["triage"])
+        _add_triage(info["triage"], summary["triage"])
+        info["total_rows"] += len(chunk)
+        rows_done += len(chunk)
+        n_chunks += 1
+        del chunk, df
+
+    summary = {
+        "triage": triage,
+        "sheets": sheets,
+        "mapping_stats": merge_mapping_info(i["mapping_stats"] for i in sheets.values()),
+        "total_rows": rows_done,
+        "chunks": n_chunks,
+    }
+    mp = next(iter(sheets.values()))["mapping"] if sheets else {}
+    return mp, final.score(), errors, summary
+
+def run_pipeline_sheets(sheets: dict, progress=None):
+    """
+    run_pipeline for every sheet of an in-memory file, SHEET_WORKERS sheets
+    at a time. Returns the same (df, mapping, quality, errors, summary) as
+    run_pipeline with the cleaned sheets concatenated in order; mapping is
+    the first sheet's and summary["sheets"] has each sheet's own.
+    """
+    if len(sheets) == 1:
+        name, original_df = next(iter(sheets.items()))
+        df, mp, quality, errors, summary = run_pipeline(original_df, progress)
+        errors = [{"sheet": name, **e} for e in errors]
+        summary["sheets"] = {name: {"mapping": mp, "mapping_stats": summary["mapping_stats"],
+                                    "total_rows": len(df), "triage": summary["triage"]}}
+        summary["mapping_stats"] = merge_mapping_info([summary["mapping_stats"]])
+        return df, mp, quality, errors, summary
+
+    report = progress or (lambda stage, done, total, quality=None: None)
+    total = sum(len(df) for df in sheets.values())
+    live, final = QualityAccumulator(), QualityAccumulator()
+    done = dict.fromkeys(sheets, 0)
+    lock = threading.Lock()
+
+    def one(name):
+        def sheet_progress(stage, n, _total, quality=None):
+            with lock:
+                done[name] = n
+                report(stage, sum(done.values()), total, live.score())
+        return run_pipeline(sheets[name], sheet_progress if progress else None, live=live, final=final)
+
+    with ThreadPoolExecutor(max_workers=min(SHEET_WORKERS, len(sheets)), thread_name_prefix="sheet") as pool:
+        results = dict(zip(sheets, pool.map(one, sheets)))
+
+    triage, errors, info = {}, [], {}
+    for name, (df, mp, _, sheet_errors, summary) in results.items():
+        errors.extend({"sheet": name, **e} for e in sheet_errors)
+        _add_triage(triage, summary["triage"])
+        info[name] = {"mapping": mp, "mapping_stats": summary["mapping_stats"],
+                      "total_rows": len(df), "triage": summary["triage"]}
+
+    df = pd.concat([r[0] for r in results.values()], ignore_index=True)
+    mp = next(iter(info.values()))["mapping"]
+    mapping_stats = merge_mapping_info(i["mapping_stats"] for i in info.values())
+    return df, mp, final.score(), errors, {"triage": triage, "sheets": info, "mapping_stats": mapping_stats}
+
+# =========================================================
+# REQUEST EXECUTOR
+# Pipeline work (Excel parsing, LLM calls, DB writes) is blocking, so the
+# async endpoints hand it to this pool and keep the event loop free for
+# /stats/, / and everything else.
+# =========================================================
+request_pool = ThreadPoolExecutor(max_workers=REQUEST_WORKERS, thread_name_prefix="request")
+
+async def offload(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(request_pool, fn, *args)
+
+# =========================================================
+# VALIDATION STAGING
+# /validate/ keeps the full cleaned DataFrame on disk (Parquet + a JSON
+# sidecar) under a validation id; /upload-validated/ commits it by id.
+# =========================================================
+STAGED_SCHEMA = pa.schema([(f, pa.string()) for f in DB_FIELDS])
+
+class StagedWriter:
+    """Appends cleaned chunks to a staged Parquet file; commit() publishes it."""
+
+    def __init__(self, store, mapping: dict):
+        os.makedirs(store.root, exist_ok=True)
+        store.purge_expired()
+        self.validation_id = uuid.uuid4().hex
+        self.mapping = mapping
+        self.rows = 0
+        self.preview = []
+        self._data_path, self._meta_path = store._paths(self.validation_id)
+        self._writer = pq.ParquetWriter(self._data_path + ".tmp", STAGED_SCHEMA)
+
+    def write(self, df: pd.DataFrame):
+        staged = ensure_columns(df.copy())[DB_FIELDS].astype("string")
+        self._writer.write_table(pa.Table.from_pandas(staged, schema=STAGED_SCHEMA, preserve_index=False))
+        if len(self.preview) < 20:
+            self.preview += df.head(20 - len(self.preview)).fillna("").to_dict("records")
+        self.rows += len(staged)
+
+    def commit(self, quality: dict, mapping: dict = None) -> str:
+        self._writer.close()
+        os.replace(self._data_path + ".tmp", self._data_path)
+        with open(self._meta_path, "w") as f:
+            json.dump({"quality": quality, "mapping": mapping or self.mapping, "total_rows": self.rows,
+                       "created_at": time.time()}, f, default=str)
+        return self.validation_id
+
+    def abort(self):
+        self._writer.close()
+        try:
+            os.remove(self._data_path + ".tmp")
+        except OSError:
+            pass
+
+class ValidationStore:
+    ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
+
+    def _paths(self, validation_id):
+        base = os.path.join(self.root, validation_id)
+        return base + ".parquet", base + ".json"
+
+    def writer(self, mapping: dict = None) -> StagedWriter:
+        return StagedWriter(self, mapping)
 
-    return df, mp, quality, errors
+    def stage(self, df: pd.DataFrame, quality: dict, mapping: dict) -> str:
+        w = self.writer(mapping)
+        w.write(df)
+        return w.commit(quality)
+
+    def meta(self, validation_id: str):
+        """Quality, mapping and row count staged with a live validation id, else None."""
+        if not self.ID_PATTERN.fullmatch(validation_id or ""):
+            return None
+        try:
+            with open(self._paths(validation_id)[1]) as f:
+                meta = json.load(f)
+            if time.time() - meta["created_at"] > self.ttl:
+                self.discard(validation_id)
+                return None
+            return meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def batches(self, validation_id: str, batch_rows: int):
+        """Iterator of DataFrames of up to `batch_rows` rows for a live validation id, else None."""
+        if self.meta(validation_id) is None:
+            return None
+        try:
+            pf = pq.ParquetFile(self._paths(validation_id)[0])
+        except (OSError, ValueError):
+            return None
+        return (batch.to_pandas() for batch in pf.iter_batches(batch_size=batch_rows))
+
+    def discard(self, validation_id: str):
+        for path in self._paths(validation_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+validation_store = ValidationStore(os.path.join(STATE_DIR, "staged"), STAGING_TTL)
 
 # =========================================================
 # VALIDATE ENDPOINT
 # =========================================================
-@app.post("/validate/")
-async def validate(file: UploadFile = File(...)):
-    original_df = pd.read_excel(file.file, dtype=str)
-    original_df.reset_index(drop=True, inplace=True)
-    create_table()
+def _validate_file(fileobj, filename=None):
+    sheets = read_sheets(fileobj, detect_file_format(fileobj, filename))
+    original_df = next(iter(sheets.values()))
 
-    df, mp, quality, errors = run_pipeline(original_df)
+    df, mp, quality, errors, summary = run_pipeline_sheets(sheets)
+    validation_id = validation_store.stage(df, quality, mp)
 
     return {
         "status": "validated",
+        "validation_id": validation_id,
+        "expires_in": STAGING_TTL,
         "mapping": mp,
+        "mapping_stats": summary["mapping_stats"],
+        "sheets": summary["sheets"],
         "quality": quality,
         "errors": errors,
+        "triage": summary["triage"],
         "total_rows": len(df),
         "preview": df.head(20).fillna("").to_dict("records"),
         "original_preview": original_df.head(20).fillna("").to_dict("records")
     }
 
+@app.post("/validate/")
+async def validate(file: UploadFile = File(...)):
+    return await offload(_validate_file, file.file, file.filename)
+
 # =========================================================
 # UPLOAD ENDPOINT (full pipeline — fallback if no validate first)
 # =========================================================
-@app.post("/upload/")
-async def upload(file: UploadFile = File(...)):
-    original_df = pd.read_excel(file.file, dtype=str)
-    original_df.reset_index(drop=True, inplace=True)
-    create_table()
+def _upload_file(fileobj, filename=None):
+    sheets = read_sheets(fileobj, detect_file_format(fileobj, filename))
 
-    df, mp, quality, errors = run_pipeline(original_df)
+    df, mp, quality, errors, summary = run_pipeline_sheets(sheets)
     ins, upd = upsert(df)
 
     return {
@@ -409,30 +2286,38 @@ async def upload(file: UploadFile = File(...)):
         "updated": upd,
         "quality": quality,
         "errors": errors,
+        "triage": summary["triage"],
+        "sheets": summary["sheets"],
         "total_rows": len(df)
     }
 
+@app.post("/upload/")
+async def upload(file: UploadFile = File(...)):
+    return await offload(_upload_file, file.file, file.filename)
+
 # =========================================================
 # UPLOAD-VALIDATED ENDPOINT
-# Accepts already-cleaned rows from the frontend session state.
-# No re-processing — straight to DB upsert.
+# Commits a staged validation by id (or, for older clients, rows posted
+# back from the frontend). No re-processing — straight to DB upsert.
 # =========================================================
-from fastapi import Body
+def _upload_staged(validation_id):
+    # Upserted STREAM_CHUNK_ROWS at a time, like a committing job
+    meta = validation_store.meta(validation_id)
+    batches = validation_store.batches(validation_id, STREAM_CHUNK_ROWS) if meta else None
+    if batches is None:
+        return {"status": "error", "message": "Unknown or expired validation id — run /validate/ again"}
 
-@app.post("/upload-validated/")
-async def upload_validated(payload: dict = Body(...)):
-    """
-    Expects: { "rows": [...], "quality": {...} }
-    Rows must already be cleaned/validated by the /validate/ pipeline.
-    """
-    rows = payload.get("rows", [])
-    quality = payload.get("quality", {})
+    ins, upd = _commit_staged(validation_id, batches, lambda *args, **kwargs: None)
 
-    if not rows:
-        return {"status": "error", "message": "No rows provided"}
-
-    create_table()
+    return {
+        "status": "success",
+        "inserted": ins,
+        "updated": upd,
+        "quality": meta["quality"],
+        "total_rows": meta["total_rows"]
+    }
 
+def _upload_rows(rows, quality):
     df = pd.DataFrame(rows)
     df = ensure_columns(df)
 
@@ -449,39 +2334,606 @@ async def upload_validated(payload: dict = Body(...)):
         "total_rows": len(df)
     }
 
+@app.post("/upload-validated/")
+async def upload_validated(payload: dict = Body(...)):
+    """
+    Expects: { "validation_id": "..." } from /validate/ (or a validation job).
+    Legacy: { "rows": [...], "quality": {...} } with rows already cleaned.
+    """
+    if payload.get("validation_id"):
+        return await offload(_upload_staged, payload["validation_id"])
+
+    rows = payload.get("rows", [])
+    quality = payload.get("quality", {})
+
+    if not rows:
+        return {"status": "error", "message": "No rows provided"}
+
+    return await offload(_upload_rows, rows, quality)
+
+# =========================================================
+# BACKGROUND JOBS
+# =========================================================
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+def worker_id() -> str:
+    """Identifies this process (pid + boot token) as the owner of the jobs it runs."""
+    return f"{os.getpid()}-{_BOOT_ID}"
+
+class JobStore:
+    """
+    SQLite-backed job records, so job state survives a restart. Each job is
+    leased by the worker process running it: the owner refreshes updated_at
+    through heartbeat(), and other uvicorn workers only take a job over
+    through claim(), once JOB_LEASE seconds pass without one.
+    """
+
+    FIELDS = ("status", "stage", "rows_done", "rows_total", "errors",
+              "quality", "result", "message", "updated_at")
+    JSON_FIELDS = ("errors", "quality", "result")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id          TEXT PRIMARY KEY,
+                    filename    TEXT,
+                    input_path  TEXT NOT NULL,
+                    commit_rows INTEGER NOT NULL DEFAULT 0,
+                    status      TEXT NOT NULL,
+                    stage       TEXT,
+                    rows_done   INTEGER NOT NULL DEFAULT 0,
+                    rows_total  INTEGER NOT NULL DEFAULT 0,
+                    errors      TEXT,
+                    quality     TEXT,
+                    result      TEXT,
+                    message     TEXT,
+                    created_at  REAL NOT NULL,
+                    updated_at  REAL NOT NULL,
+                    owner       TEXT
+                )
+            """)
+            try:
+                # jobs.db files from before job ownership
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            except sqlite3.OperationalError:
+                pass
+            self._conn.commit()
+        return self._conn
+
+    def create(self, filename, input_path, commit_rows) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO jobs (id, filename, input_path, commit_rows, status, stage, created_at, updated_at, owner) "
+                "VALUES (?, ?, ?, ?, 'queued', 'queued', ?, ?, ?)",
+                (job_id, filename, input_path, int(commit_rows), now, now, worker_id())
+            )
+            db.commit()
+        return job_id
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        cols = [f for f in fields if f in self.FIELDS]
+        values = [
+            json.dumps(fields[f], default=str) if f in self.JSON_FIELDS else fields[f]
+            for f in cols
+        ]
+        with self._lock:
+            db = self._db()
+            db.execute(
+                f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?",
+                (*values, job_id)
+            )
+            db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            cur = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cur.fetchone()
+            names = [d[0] for d in cur.description]
+        if not row:
+            return None
+        job = dict(zip(names, row))
+        for f in self.JSON_FIELDS:
+            job[f] = json.loads(job[f]) if job[f] else None
+        job["commit_rows"] = bool(job["commit_rows"])
+        return job
+
+    # Unfinished, and either unowned or owned by a worker whose lease ran out
+    _EXPIRED = (
+        "status IN ('queued', 'running') AND owner IS NOT ? "
+        "AND (owner IS NULL OR updated_at < ?)"
+    )
+
+    def heartbeat(self) -> int:
+        """Renew the lease on every unfinished job this worker owns."""
+        with self._lock:
+            db = self._db()
+            cur = db.execute(
+                "UPDATE jobs SET updated_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                (time.time(), worker_id())
+            )
+            db.commit()
+            return cur.rowcount
+
+    def expired(self) -> list:
+        """Ids of unfinished jobs whose lease has run out, oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT id FROM jobs WHERE {self._EXPIRED} ORDER BY created_at",
+                (worker_id(), time.time() - JOB_LEASE)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def claim(self, job_id) -> bool:
+        """
+        Take over an unfinished job whose lease has run out. The conditional
+        UPDATE is atomic across processes, so of several workers resuming
+        at once exactly one wins.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            cur = db.execute(
+                "UPDATE jobs SET owner = ?, status = 'queued', updated_at = ? "
+                f"WHERE id = ? AND {self._EXPIRED}",
+                (worker_id(), now, job_id, worker_id(), now - JOB_LEASE)
+            )
+            db.commit()
+            return cur.rowcount == 1
+
+job_store = JobStore(os.path.join(STATE_DIR, "jobs.db"))
+job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+def _commit_staged(validation_id, batches, progress):
+    """Upsert a staged validation batch by batch; returns (inserted, updated)."""
+    ins, upd, done = 0, 0, 0
+    for df in batches:
+        i, u = upsert(df)
+        ins, upd, done = ins + i, upd + u, done + len(df)
+        progress("committing", done, None)
+    validation_store.discard(validation_id)
+    return ins, upd
+
+def run_job(job_id: str):
+    """
+    Worker body: run the pipeline for one stored job and record progress.
+    Files of STREAM_MIN_BYTES or more are streamed in STREAM_CHUNK_ROWS
+    chunks, each staged before the next is read; smaller ones are read
+    whole with their sheets processed in parallel. Peak RSS, sampled at
+    every progress tick, is reported either way.
+    Cleaned rows are always staged first. With commit_rows the staged
+    file is then upserted and the job records its validation id before
+    it starts, so a job resumed mid-commit re-upserts the same rows (same
+    applicant IDs, hence updates) instead of re-running the pipeline.
+    """
+    job = job_store.get(job_id)
+    if not job:
+        return
+    job_store.update(job_id, status="running")
+    staged = None
+    peak = [rss_mb()]
+    try:
+        path = job["input_path"]
+
+        last = {"stage": None, "at": 0.0}
+
+        def progress(stage, done, total, quality=None):
+            peak[0] = max(peak[0], rss_mb())
+            # One SQLite write per PROGRESS_INTERVAL, plus one per stage change
+            now = time.monotonic()
+            if stage == last["stage"] and now - last["at"] < PROGRESS_INTERVAL:
+                return
+            last.update(stage=stage, at=now)
+            fields = {"stage": stage, "rows_done": done}
+            if total is not None:
+                fields["rows_total"] = total
+            if quality:
+                fields["quality"] = quality
+            job_store.update(job_id, **fields)
+
+        result = job["result"] or {}
+        batches = None
+        if job["commit_rows"] and job["stage"] == "committing":
+            batches = validation_store.batches(result.get("validation_id"), STREAM_CHUNK_ROWS)
+        if batches is not None:
+            quality, errors = job["quality"], job["errors"] or []
+        else:
+            job_store.update(job_id, stage="reading")
+            fmt = detect_file_format(path, job["filename"])
+            streamed = os.path.getsize(path) >= STREAM_MIN_BYTES
+            staged = validation_store.writer()
+
+            if streamed:
+                chunks, total = iter_chunks(path, fmt)
+                first = next(chunks)
+                original_preview = first[1].head(20).fillna("").to_dict("records")
+                chunks = itertools.chain([first], chunks)
+                del first
+                mp, quality, errors, summary = run_pipeline_chunked(
+                    chunks, total, staged.write, progress=progress
+                )
+            else:
+                sheets = read_sheets(path, fmt)
+                original_preview = next(iter(sheets.values())).head(20).fillna("").to_dict("records")
+                df, mp, quality, errors, summary = run_pipeline_sheets(sheets, progress=progress)
+                del sheets
+                progress("saving", len(df), len(df))
+                staged.write(df)
+                summary.update(total_rows=len(df), chunks=1)
+                del df
+            peak[0] = max(peak[0], rss_mb())
+
+            result = {
+                "mapping": mp, "mapping_stats": summary["mapping_stats"],
+                "sheets": summary["sheets"], "triage": summary["triage"],
+                "total_rows": summary["total_rows"], "format": fmt, "streamed": streamed,
+                "chunks": summary["chunks"], "peak_rss_mb": round(peak[0], 1),
+                "validation_id": staged.commit(quality, mp),
+                "expires_in": STAGING_TTL,
+                "preview": staged.preview,
+                "original_preview": original_preview,
+            }
+            staged = None
+
+            if job["commit_rows"]:
+                # Checkpoint: from here on a restart only repeats the upsert
+                job_store.update(job_id, stage="committing", result=result, quality=quality, errors=errors)
+                batches = validation_store.batches(result["validation_id"], STREAM_CHUNK_ROWS)
+
+        if job["commit_rows"]:
+            validation_id = result.pop("validation_id")
+            for key in ("expires_in", "preview", "original_preview"):
+                result.pop(key, None)
+            result["inserted"], result["updated"] = _commit_staged(validation_id, batches, progress)
+
+        job_store.update(
+            job_id, status="done", stage="done",
+            rows_done=result["total_rows"], rows_total=result["total_rows"],
+            errors=errors, quality=quality, result=result
+        )
+    except Exception as e:
+        if staged:
+            staged.abort()
+        job_store.update(job_id, status="failed", message=str(e))
+    else:
+        try:
+            os.remove(job["input_path"])
+        except OSError:
+            pass
+
+def resume_jobs():
+    """
+    Re-queue jobs that were queued or mid-run when their worker process
+    stopped heartbeating. Runs in every uvicorn worker; claim() makes sure
+    each job is picked up by exactly one. The stage is kept: "committing"
+    tells run_job to resume from the staged file.
+    """
+    for job_id in job_store.expired():
+        if job_store.claim(job_id):
+            job_pool.submit(run_job, job_id)
+
+class JobReaper:
+    """
+    Background thread that renews this worker's job leases and takes over
+    jobs whose owner stopped renewing, every JOB_LEASE / 3 seconds.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(JOB_LEASE / 3):
+            try:
+                job_store.heartbeat()
+                resume_jobs()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+job_reaper = JobReaper()
+
+def _save_upload(fileobj, path):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f)
+
+@app.post("/jobs/")
+async def create_job(file: UploadFile = File(...), commit: bool = False):
+    """
+    Queue a file (xlsx, csv or parquet) for background processing and return its job id immediately.
+    With ?commit=true the cleaned rows are upserted when the pipeline finishes.
+    """
+    inbox = os.path.join(STATE_DIR, "jobs")
+    os.makedirs(inbox, exist_ok=True)
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    input_path = os.path.join(inbox, uuid.uuid4().hex + (ext if ext[1:].isalnum() else ".xlsx"))
+    await offload(_save_upload, file.file, input_path)
+
+    job_id = await offload(job_store.create, file.filename, input_path, commit)
+    job_pool.submit(run_job, job_id)
+    return {"status": "queued", "job_id": job_id}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if not job:
+        return {"status": "error", "message": "Unknown job id"}
+    job.pop("input_path", None)
+    return job
+
+# =========================================================
+# RECORDS ENDPOINT (keyset pagination, newest first)
+# Pages are addressed by the last (created_at, applicant_id) seen, so
+# every page is an index range scan no matter how deep it is.
+# =========================================================
+def encode_cursor(created_at, applicant_id) -> str:
+    raw = json.dumps([str(created_at), applicant_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    created_at, applicant_id = json.loads(raw)
+    return created_at, applicant_id
+
+def record_filters(purpose: str = None, employment_type: str = None,
+                   min_income: float = None, max_income: float = None) -> tuple:
+    """WHERE clauses + params shared by /records/ and /export/."""
+    where, params = [], {}
+    if purpose:
+        where.append("loan_purpose = :purpose")
+        params["purpose"] = purpose
+    if employment_type:
+        where.append("employment_type = :employment_type")
+        params["employment_type"] = employment_type
+    if min_income is not None:
+        where.append("monthly_income >= :min_income")
+        params["min_income"] = min_income
+    if max_income is not None:
+        where.append("monthly_income <= :max_income")
+        params["max_income"] = max_income
+    return where, params
+
+def fetch_records(limit: int, cursor: str = None, purpose: str = None,
+                  employment_type: str = None, min_income: float = None,
+                  max_income: float = None) -> dict:
+    where, params = record_filters(purpose, employment_type, min_income, max_income)
+    params["limit"] = limit + 1
+    if cursor:
+        params["c_created"], params["c_id"] = decode_cursor(cursor)
+        where.append("(created_at < :c_created OR (created_at = :c_created AND applicant_id < :c_id))")
+
+    sql = f"""
+    SELECT {', '.join(DB_FIELDS)}, created_at FROM loan_applicants
+    {'WHERE ' + ' AND '.join(where) if where else ''}
+    ORDER BY created_at DESC, applicant_id DESC
+    LIMIT :limit
+    """
+    with engine.connect() as conn:
+        rows = [dict(r._mapping) for r in conn.execute(text(sql), params)]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["applicant_id"])
+    return {"records": rows, "count": len(rows), "next_cursor": next_cursor}
+
+@app.get("/records/")
+def records(limit: int = RECORDS_PAGE_SIZE, cursor: str = None, purpose: str = None,
+            employment_type: str = None, min_income: float = None, max_income: float = None):
+    try:
+        limit = max(1, min(limit, RECORDS_PAGE_MAX))
+        return fetch_records(limit, cursor, purpose, employment_type, min_income, max_income)
+    except (ValueError, TypeError):
+        return {"status": "error", "message": "Invalid cursor"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+# =========================================================
+# EXPORT ENDPOINT (whole table, streamed through a server-side cursor)
+# Only one EXPORT_CHUNK_SIZE slice of rows is held in memory at a time.
+# =========================================================
+EXPORT_COLUMNS = DB_FIELDS + ["created_at"]
+EXPORT_SCHEMA = pa.schema(
+    [(c, pa.float64() if c in ("loan_amount", "monthly_income") else pa.string()) for c in DB_FIELDS]
+    + [("created_at", pa.timestamp("us"))]
+)
+XLSX_MAX_ROWS = 1_048_575   # per sheet, after the header row
+EXPORT_TYPES = {
+    "csv":     "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx":    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def export_chunks(where: list, params: dict):
+    """Yield lists of row tuples, EXPORT_CHUNK_SIZE at a time, off an unbuffered cursor."""
+    sql = f"""
+    SELECT {', '.join(EXPORT_COLUMNS)} FROM loan_applicants
+    {'WHERE ' + ' AND '.join(where) if where else ''}
+    ORDER BY created_at DESC, applicant_id DESC
+    """
+    with engine.connect() as conn:
+        stmt = text(sql).execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+        for part in conn.execute(stmt, params).partitions(EXPORT_CHUNK_SIZE):
+            yield [tuple(r) for r in part]
+
+def _export_frame(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS, dtype=object)
+    for col in ("loan_amount", "monthly_income"):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    return df
+
+def stream_csv(where: list, params: dict):
+    yield ",".join(EXPORT_COLUMNS) + "\n"
+    for rows in export_chunks(where, params):
+        yield _export_frame(rows).to_csv(index=False, header=False)
+
+class _ByteSink:
+    """Write-only file object for ParquetWriter; drained after every row group."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+def stream_parquet(where: list, params: dict):
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, EXPORT_SCHEMA)
+    for rows in export_chunks(where, params):
+        writer.write_table(pa.Table.from_pandas(_export_frame(rows), schema=EXPORT_SCHEMA, preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def write_xlsx(path: str, where: list, params: dict):
+    """Write-only workbook: rows go straight to disk, new sheet every XLSX_MAX_ROWS."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws, n = None, XLSX_MAX_ROWS
+    for rows in export_chunks(where, params):
+        for row in rows:
+            if n >= XLSX_MAX_ROWS:
+                ws = wb.create_sheet(f"loan_applicants_{len(wb.sheetnames) + 1}")
+                ws.append(EXPORT_COLUMNS)
+                n = 0
+            ws.append(row)
+            n += 1
+    if ws is None:
+        wb.create_sheet("loan_applicants_1").append(EXPORT_COLUMNS)
+    wb.save(path)
+
+@app.get("/export/")
+def export(format: str = "csv", purpose: str = None, employment_type: str = None,
+           min_income: float = None, max_income: float = None):
+    if format not in EXPORT_TYPES:
+        return {"status": "error", "message": f"format must be one of {', '.join(EXPORT_TYPES)}"}
+    where, params = record_filters(purpose, employment_type, min_income, max_income)
+    filename = f"loan_applicants.{format}"
+
+    if format == "xlsx":
+        # xlsx is a zip, so it can only be sent once complete; build it on disk
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            write_xlsx(path, where, params)
+        except Exception:
+            os.remove(path)
+            raise
+        return FileResponse(path, media_type=EXPORT_TYPES[format], filename=filename,
+                            background=BackgroundTask(os.remove, path))
+
+    stream = stream_csv if format == "csv" else stream_parquet
+    return StreamingResponse(
+        stream(where, params),
+        media_type=EXPORT_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # =========================================================
 # STATS ENDPOINT
 # =========================================================
 @app.get("/stats/")
 def stats():
     try:
-        with engine.connect() as conn:
-            total = conn.execute(text("SELECT COUNT(*) FROM loan_applicants")).scalar()
-            by_purpose = conn.execute(text(
-                "SELECT loan_purpose, COUNT(*) as cnt FROM loan_applicants GROUP BY loan_purpose"
-            )).fetchall()
-            by_employment = conn.execute(text(
-                "SELECT employment_type, COUNT(*) as cnt FROM loan_applicants GROUP BY employment_type"
-            )).fetchall()
-            avg_loan = conn.execute(text(
-                "SELECT AVG(loan_amount) FROM loan_applicants WHERE loan_amount IS NOT NULL"
-            )).scalar()
-            avg_income = conn.execute(text(
-                "SELECT AVG(monthly_income) FROM loan_applicants WHERE monthly_income IS NOT NULL"
-            )).scalar()
-        return {
-            "total_applicants": total,
-            "by_purpose": [{"purpose": r[0], "count": r[1]} for r in by_purpose],
-            "by_employment": [{"type": r[0], "count": r[1]} for r in by_employment],
-            "avg_loan_amount": round(float(avg_loan), 2) if avg_loan else 0,
-            "avg_monthly_income": round(float(avg_income), 2) if avg_income else 0,
-        }
+        payload, age = stats_cache.get(read_stats)
+        return {**payload, "cache_age_seconds": round(age, 1)}
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/stats/rebuild/")
+def stats_rebuild():
+    rebuild_stats()
+    return {"status": "rebuilt", **read_stats()}
+
+# =========================================================
+# CACHE STATS ENDPOINT
+# =========================================================
+@app.get("/cache/stats/")
+def cache_stats():
+    return {"repair": repair_cache.stats(), "mapping": mapping_cache.stats(), "stats": stats_cache.stats()}
+
+# =========================================================
+# LLM CLIENT HEALTH ENDPOINT
+# =========================================================
+@app.get("/llm/health/")
+def llm_health():
+    return {
+        client.name: {
+            "url_configured": bool(client.url),
+            "circuit": client.breaker.state,
+            "limiter": client.limiter.stats(),
+        }
+        for client in (mapping_client, repair_client)
+    }
+
+# =========================================================
+# MAPPING CACHE ENDPOINTS
+# =========================================================
+@app.get("/mappings/")
+def list_mappings():
+    return {"mappings": mapping_cache.entries()}
+
+@app.put("/mappings/pin/")
+def pin_mapping(payload: dict = Body(...)):
+    """
+    Expects: { "columns": [...], "mapping": {...} }
+    Pins the mapping for this header layout; omit "mapping" to pin the cached one.
+    """
+    cols = payload.get("columns", [])
+    if not cols:
+        return {"status": "error", "message": "No columns provided"}
+    mp = payload.get("mapping") or mapping_cache.get(cols)
+    if not mp:
+        return {"status": "error", "message": "No mapping provided or cached for these columns"}
+    sig = mapping_cache.put(cols, mp, pinned=True)
+    return {"status": "pinned", "signature": sig, "mapping": mp}
+
+@app.delete("/mappings/{signature}")
+def invalidate_mapping(signature: str):
+    if not mapping_cache.invalidate(signature):
+        return {"status": "error", "message": "Unknown signature"}
+    return {"status": "invalidated", "signature": signature}
+
 # =========================================================
 # ROOT
 # =========================================================
 @app.get("/")
 def root():
-    return {"msg": "Loan Applicant AI Ingestion System — Dual LLM Pipeline"}
\ No newline at end of file
+    return {"msg": "Loan Applicant AI Ingestion System — Dual LLM Pipeline"}
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["rebuild-stats"]:
+        rebuild_stats()
+        print(json.dumps(read_stats(), indent=2))
+    elif sys.argv[1:] == ["migrate"]:
+        migrate()
+    else:
+        print("usage: python main_llm.py [migrate | rebuild-stats]")